@@ -52,6 +52,30 @@ def save():
     return _session.save()
 
 
+@app.route("/undo", methods=['POST'])
+@errors.handler
+def undo():
+    assert htmx is not None
+
+    return _session.undo()
+
+
+@app.route("/redo", methods=['POST'])
+@errors.handler
+def redo():
+    assert htmx is not None
+
+    return _session.redo()
+
+
+@app.route("/autosave", methods=['POST'])
+@errors.handler
+def autosave():
+    assert htmx is not None
+
+    return _session.autosave()
+
+
 @app.route("/help/toggle", methods=['PUT'])
 @errors.handler
 def toggle_help():
@@ -153,8 +177,19 @@ def update_search_results():
     assert htmx is not None
 
     text = request.form["text-search"]
+    # Checkboxes are only sent when checked.
+    case_sensitive = "case-insensitive" not in request.form
+    regex = "regex" in request.form
+
+    return _session.update_search_results(text, case_sensitive, regex)
+
+
+@app.route("/selector/search/more/<int:row>/<int:col>", methods=['POST'])
+@errors.handler
+def render_more_search_results(row, col):
+    assert htmx is not None
 
-    return _session.update_search_results(text)
+    return _session.render_more_search_results((row, col))
 
 
 @app.route(
@@ -8,3 +8,21 @@ class Settings(object):
     DIM_SHEET_COLS = 20
     MIN_PORT = 15000
     MAX_PORT = 15100
+    FORMULA_CACHE_SIZE = 4096
+    FRAGMENT_CACHE_SIZE = 4096
+    RECALC_EAGERLY = False
+    WORKERS = None
+    RECALC_PARALLEL_THRESHOLD = 1000
+    RESET_COMPUTED_THRESHOLD = 10000
+    SEARCH_PAGE_SIZE = 100
+    FAST_LOAD_THRESHOLD = 16 * 1024 * 1024
+    PARALLEL_LOAD_THRESHOLD = 64 * 1024 * 1024
+    FAST_SAVE_THRESHOLD = 1_000_000
+    LAZY_LOAD_THRESHOLD = 256 * 1024 * 1024
+    LAZY_BLOCK_ROWS = 1024
+    LAZY_CACHE_BLOCKS = 64
+    SPARSE_MIN_CELLS = 1_000_000
+    SPARSE_MAX_DENSITY = 0.1
+    SNAPSHOT = False
+    AUTOSAVE_INTERVAL = None
+    UNDO_MEMORY = 64 * 1024 * 1024
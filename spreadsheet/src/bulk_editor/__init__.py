@@ -6,6 +6,7 @@ import src.selector.state as sel_state
 import src.selector.types as sel_types
 import src.sheet as sheet
 
+import src.bulk_editor.modifications as modifications
 import src.bulk_editor.operations as operations
 
 
@@ -31,6 +32,18 @@ def apply(name, form):
     operations.apply(name, form)
 
 
+def update_cell_value(cell_position, value):
+    modifications.update_cell_value(cell_position, value)
+
+
+def undo():
+    modifications.undo()
+
+
+def redo():
+    modifications.redo()
+
+
 def get_shortcut_inputs(shortcut):
     name = None
     form = None
@@ -56,6 +69,12 @@ def get_shortcut_inputs(shortcut):
             form = None
             selection = sel_state.get_selection()
             sels = {"target": selection}
+            # Sort a box by its first column.
+            if isinstance(selection, sel_types.Box):
+                sels = {
+                    "input": selection,
+                    "target": sel_types.ColIndex(selection.col_range.start.value),
+                }
         case "Reverse":
             name = "Reverse"
             form = None
@@ -1,13 +1,19 @@
-from dataclasses import dataclass
-from typing import Any
+import src.errors.types as err_types
+import src.sheet as sheet
 
 from src.bulk_editor.modifications.insert import Insert, Input as InsertInput
 from src.bulk_editor.modifications.delete import Delete, Input as DeleteInput
 from src.bulk_editor.modifications.value import Value, Input as ValueInput
 from src.bulk_editor.modifications.copy import Copy, Input as CopyInput
 from src.bulk_editor.modifications.paste import Paste, Input as PasteInput
-from src.bulk_editor.modifications.sort import Sort, Input as SortInput
+from src.bulk_editor.modifications.sort import Sort, Input as SortInput, Key as SortKey
 from src.bulk_editor.modifications.reverse import Reverse, Input as ReverseInput
+from src.bulk_editor.modifications.move import Move, Input as MoveInput
+from src.bulk_editor.modifications.restore import Restore, Input as RestoreInput
+from src.bulk_editor.modifications.take import Take, Input as TakeInput
+from src.bulk_editor.modifications.types import Transaction
+import src.bulk_editor.modifications.journal as journal
+import src.bulk_editor.modifications.restore as restore
 
 
 modifications = [
@@ -18,16 +24,62 @@ modifications = [
     Paste,
     Sort,
     Reverse,
+    Move,
+    Restore,
+    Take,
 ]
 modifications_map = {m.name(): m for m in modifications}
 
 
-@dataclass
-class Transaction:
-    modification_name: str
-    input: Any
+def apply_all(transactions):
+    # Modifying a lazily opened sheet parses all of it, after which
+    # what is computed from it is rebuilt for every row.
+    reset = sheet.data.is_lazy()
+    for transaction in transactions:
+        modification = modifications_map[transaction.modification_name]
+        modification.apply(transaction.input)
+        # Cells may have moved or changed, so unless the modification
+        # updates what it changed, recompute from scratch once done.
+        if not reset:
+            reset = not modification.update_computed(transaction.input)
+    if reset:
+        sheet.reset_computed()
 
 
 def apply_transaction(transaction):
     modification = modifications_map[transaction.modification_name]
-    modification.apply(transaction.input)
+    if not modification.modifies_sheet():
+        modification.apply(transaction.input)
+        return
+
+    # Record how to undo the modification before it changes the sheet.
+    redo, undo = modification.record(transaction.input)
+    apply_all(redo)
+    journal.add(redo, undo)
+
+
+# Edits of a cell are journaled as restoring the cell, so undoing and
+# redoing modifications around them does not overwrite them.
+def update_cell_value(cell_position, value):
+    row = cell_position.row_index.value
+    col = cell_position.col_index.value
+
+    undo = restore.get_input(row, col, (1, 1))
+    sheet.update_cell_value(cell_position, value)
+    redo = restore.get_input(row, col, (1, 1))
+    journal.add(
+        [Transaction(modification_name="RESTORE", input=redo)],
+        [Transaction(modification_name="RESTORE", input=undo)],
+    )
+
+
+def undo():
+    if not journal.can_undo():
+        raise err_types.UserError("Nothing to undo.")
+    apply_all(journal.pop_undo().undo)
+
+
+def redo():
+    if not journal.can_redo():
+        raise err_types.UserError("Nothing to redo.")
+    apply_all(journal.pop_redo().redo)
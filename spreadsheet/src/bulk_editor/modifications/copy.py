@@ -18,6 +18,10 @@ class Copy(Modification):
     def name(cls):
         return "COPY"
 
+    @classmethod
+    def modifies_sheet(cls):
+        return False
+
     @classmethod
     def apply(cls, input: Input):
         sel = input.selection
@@ -25,6 +29,5 @@ class Copy(Modification):
         row_start, row_end, col_start, col_end = \
             sel_helpers.get_bounds_from_selection(sel)
 
-        ptr = sheet.data.get()
-        buf = ptr[row_start:row_end, col_start:col_end]
+        buf = sheet.data.get_region(row_start, row_end, col_start, col_end)
         state.set_buffer(buf)
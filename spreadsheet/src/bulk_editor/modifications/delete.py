@@ -1,12 +1,13 @@
 from dataclasses import dataclass
-import numpy as np
 
 import src.errors.types as err_types
 import src.selector.types as sel_types
 import src.sheet as sheet
 
 from src.bulk_editor.modifications.modification import Modification
-from src.bulk_editor.modifications.types import Axis
+from src.bulk_editor.modifications.types import Axis, Transaction
+import src.bulk_editor.modifications.insert as insert
+import src.bulk_editor.modifications.restore as restore
 
 
 @dataclass
@@ -44,6 +45,41 @@ class Delete(Modification):
         assert end is not None
         assert axis is not None
 
-        ptr = sheet.data.get()
         indices = list(range(start, end))
-        sheet.data.set(np.delete(ptr, indices, axis.value))
+        sheet.data.delete(axis.value, indices)
+
+    # Deleted cells are restored by inserting empty rows or columns
+    # and setting them to the deleted cells.
+    @classmethod
+    def record(cls, input: Input):
+        sel = input.selection
+        start = sel.start.value
+        number = sel.end.value - start
+        bounds = sheet.data.get_bounds()
+
+        target = None
+        restored = None
+        if isinstance(sel, sel_types.RowRange):
+            target = sel_types.RowIndex(start)
+            restored = restore.get_input(
+                start, 0, (number, bounds.col.value),
+            )
+        elif isinstance(sel, sel_types.ColRange):
+            target = sel_types.ColIndex(start)
+            restored = restore.get_input(
+                0, start, (bounds.row.value, number),
+            )
+        else:
+            raise err_types.NotSupportedError(
+                f"Selection type {type(sel)} is not valid for delete."
+            )
+
+        redo = [Transaction(modification_name=cls.name(), input=input)]
+        undo = [
+            Transaction(
+                modification_name="INSERT",
+                input=insert.Input(target=target, number=number),
+            ),
+            Transaction(modification_name="RESTORE", input=restored),
+        ]
+        return redo, undo
@@ -1,12 +1,13 @@
 from dataclasses import dataclass
-import numpy as np
 
 import src.errors.types as err_types
 import src.selector.types as sel_types
 import src.sheet as sheet
+import src.sheet.types as sheet_types
 
 from src.bulk_editor.modifications.modification import Modification
-from src.bulk_editor.modifications.types import Axis
+from src.bulk_editor.modifications.types import Axis, Transaction
+import src.bulk_editor.modifications.delete as delete
 
 
 @dataclass
@@ -42,11 +43,48 @@ class Insert(Modification):
         assert index is not None
         assert axis is not None
 
-        ptr = sheet.data.get()
-        insertion = np.array([[None] * number])
-        sheet.data.set(np.insert(
-            ptr,
-            [index] * number,
-            insertion if axis == Axis.COLUMN else insertion.T,
-            axis=axis.value,
-        ))
+        sheet.data.insert(axis.value, index, number)
+
+    # Rows and columns appended to the sheet leave the other cells
+    # where they were.
+    @classmethod
+    def update_computed(cls, input: Input):
+        target = input.target
+        bounds = sheet.data.get_bounds()
+
+        axis = None
+        bound = None
+        if isinstance(target, sel_types.RowIndex):
+            axis = Axis.ROW
+            bound = bounds.row.value
+        else:
+            axis = Axis.COLUMN
+            bound = bounds.col.value
+
+        if target.value + input.number != bound:
+            return False
+        sheet.extend_computed(axis.value, input.number)
+        return True
+
+    @classmethod
+    def record(cls, input: Input):
+        target = input.target
+        start = sheet_types.Index(target.value)
+        end = sheet_types.Bound(target.value + input.number)
+
+        inserted = None
+        if isinstance(target, sel_types.RowIndex):
+            inserted = sel_types.RowRange(start=start, end=end)
+        elif isinstance(target, sel_types.ColIndex):
+            inserted = sel_types.ColRange(start=start, end=end)
+        else:
+            raise err_types.NotSupportedError(
+                f"Selection type, {type(target)}, is not valid for insert."
+            )
+
+        redo = [Transaction(modification_name=cls.name(), input=input)]
+        undo = [Transaction(
+            modification_name="DELETE",
+            input=delete.Input(selection=inserted),
+        )]
+        return redo, undo
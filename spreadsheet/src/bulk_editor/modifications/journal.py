@@ -0,0 +1,89 @@
+from dataclasses import dataclass, fields
+import numpy as np
+import sys
+from typing import List
+
+from settings import Settings
+
+from src.bulk_editor.modifications.types import Transaction
+
+
+# Journal of the modifications of the sheet, to undo and redo them.
+# Each entry holds the transactions that redo the modification and
+# those that undo it, which only hold the cells the modification changed,
+# e.g. the cells deleted or pasted over, or the order rows were sorted in.
+# The oldest entries are dropped once the entries take up more than
+# UNDO_MEMORY bytes.
+@dataclass
+class Entry:
+    redo: List[Transaction]
+    undo: List[Transaction]
+    size: int
+
+
+undo_entries: List[Entry] = []
+redo_entries: List[Entry] = []
+size = 0
+
+
+def init():
+    global undo_entries, redo_entries, size
+    undo_entries = []
+    redo_entries = []
+    size = 0
+
+
+# Bytes taken up by the arrays of values held by the transactions.
+def get_size(transactions):
+    total = 0
+    for transaction in transactions:
+        for field in fields(transaction.input):
+            value = getattr(transaction.input, field.name)
+            if not isinstance(value, np.ndarray):
+                continue
+            total += value.nbytes
+            if value.dtype == object:
+                total += sum(map(sys.getsizeof, value[np.not_equal(value, None)]))
+    return total
+
+
+def drop_oldest():
+    global size
+    while size > Settings.UNDO_MEMORY and len(undo_entries) > 0:
+        size -= undo_entries.pop(0).size
+    # The entries redone last are the farthest from the sheet as it is.
+    while size > Settings.UNDO_MEMORY and len(redo_entries) > 0:
+        size -= redo_entries.pop(0).size
+
+
+def add(redo, undo):
+    global redo_entries, size
+    size -= sum([entry.size for entry in redo_entries])
+    redo_entries = []
+
+    entry = Entry(redo=redo, undo=undo, size=get_size(redo + undo))
+    undo_entries.append(entry)
+    size += entry.size
+    drop_oldest()
+
+
+def can_undo():
+    return len(undo_entries) > 0
+
+
+def can_redo():
+    return len(redo_entries) > 0
+
+
+# Entry to undo, which is then the next to redo.
+def pop_undo():
+    entry = undo_entries.pop()
+    redo_entries.append(entry)
+    return entry
+
+
+# Entry to redo, which is then the next to undo.
+def pop_redo():
+    entry = redo_entries.pop()
+    undo_entries.append(entry)
+    return entry
@@ -7,3 +7,20 @@ class Modification:
     @classmethod
     def apply(cls, input):
         raise Exception("Not implemented")
+
+    # Transactions that redo and undo applying the input to the sheet
+    # as it is now, for modifications of the sheet.
+    @classmethod
+    def record(cls, input):
+        raise Exception("Not implemented")
+
+    # Update what is computed from the sheet for the input just applied,
+    # returning whether it was updated. Otherwise the sheet is
+    # recomputed from scratch.
+    @classmethod
+    def update_computed(cls, input):
+        return False
+
+    @classmethod
+    def modifies_sheet(cls):
+        return True
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+
+import src.errors.types as err_types
+import src.selector.types as sel_types
+import src.sheet as sheet
+import src.sheet.types as sheet_types
+
+from src.bulk_editor.modifications.modification import Modification
+from src.bulk_editor.modifications.types import Axis, Transaction
+
+
+@dataclass
+class Input:
+    selection: sel_types.RowRange | sel_types.ColRange
+    # Where the selection starts once moved.
+    target: sel_types.RowIndex | sel_types.ColIndex
+
+
+class Move(Modification):
+    @classmethod
+    def name(cls):
+        return "MOVE"
+
+    @classmethod
+    def apply(cls, input: Input):
+        sel = input.selection
+        target = input.target
+
+        axis = None
+        bound = None
+        if isinstance(sel, sel_types.RowRange) \
+                and isinstance(target, sel_types.RowIndex):
+            axis = Axis.ROW
+            bound = sheet.data.get_bounds().row.value
+        elif isinstance(sel, sel_types.ColRange) \
+                and isinstance(target, sel_types.ColIndex):
+            axis = Axis.COLUMN
+            bound = sheet.data.get_bounds().col.value
+        else:
+            raise err_types.NotSupportedError(
+                f"Selection type {type(sel)} with target type {type(target)} is not valid for move."
+            )
+
+        assert axis is not None
+        assert bound is not None
+
+        start = sel.start.value
+        end = sel.end.value
+        if target.value < 0 or target.value + end - start > bound:
+            raise err_types.UserError(
+                "Cannot move selection past the bounds of the sheet."
+            )
+
+        sheet.data.move(axis.value, start, end, target.value)
+
+    # Moved cells are moved back from where they end up.
+    @classmethod
+    def record(cls, input: Input):
+        sel = input.selection
+        start = input.target.value
+        end = start + sel.end.value - sel.start.value
+        moved = type(sel)(
+            start=sheet_types.Index(start), end=sheet_types.Bound(end),
+        )
+        back = type(input.target)(sel.start.value)
+
+        redo = [Transaction(modification_name=cls.name(), input=input)]
+        undo = [Transaction(
+            modification_name=cls.name(),
+            input=Input(selection=moved, target=back),
+        )]
+        return redo, undo
@@ -3,10 +3,14 @@ from dataclasses import dataclass
 import src.errors.types as err_types
 import src.selector.types as sel_types
 import src.sheet as sheet
+import src.sheet.types as sheet_types
 
 from src.bulk_editor.modifications.modification import Modification
 import src.bulk_editor.modifications.state as state
 from src.bulk_editor.modifications.insert import Insert, Input as InsertInput
+from src.bulk_editor.modifications.types import Transaction
+import src.bulk_editor.modifications.delete as delete
+import src.bulk_editor.modifications.restore as restore
 
 
 @dataclass
@@ -21,12 +25,94 @@ class Paste(Modification):
 
     @classmethod
     def apply(cls, input: Input):
-        target = input.target
+        buf = cls._get_buffer()
+        row_start, row_end, col_start, col_end = cls._get_box(input.target, buf)
 
+        bounds = sheet.data.get_bounds()
+        row_bound = bounds.row.value
+        col_bound = bounds.col.value
+
+        # insert more rows and columns if needed
+        if row_end > row_bound:
+            number = row_end - row_bound
+            Insert.apply(
+                InsertInput(target=sel_types.RowIndex(row_bound), number=number)
+            )
+        if col_end > col_bound:
+            number = col_end - col_bound
+            Insert.apply(
+                InsertInput(target=sel_types.ColIndex(col_bound), number=number)
+            )
+
+        sheet.data.set_region(row_start, row_end, col_start, col_end, buf)
+
+    # Pasting is redone from the buffer as it is now, rather than
+    # whatever is copied next, and undone by restoring the cells pasted
+    # over and deleting the rows and columns inserted.
+    @classmethod
+    def record(cls, input: Input):
+        buf = cls._get_buffer()
+        row_start, row_end, col_start, col_end = cls._get_box(input.target, buf)
+
+        bounds = sheet.data.get_bounds()
+        row_bound = bounds.row.value
+        col_bound = bounds.col.value
+
+        redo = []
+        undo = [Transaction(
+            modification_name="RESTORE",
+            input=restore.get_input(row_start, col_start, (
+                min(row_end, row_bound) - row_start,
+                min(col_end, col_bound) - col_start,
+            )),
+        )]
+        if row_end > row_bound:
+            redo.append(Transaction(
+                modification_name="INSERT",
+                input=InsertInput(
+                    target=sel_types.RowIndex(row_bound),
+                    number=row_end - row_bound,
+                ),
+            ))
+        if col_end > col_bound:
+            redo.append(Transaction(
+                modification_name="INSERT",
+                input=InsertInput(
+                    target=sel_types.ColIndex(col_bound),
+                    number=col_end - col_bound,
+                ),
+            ))
+            undo.append(Transaction(
+                modification_name="DELETE",
+                input=delete.Input(selection=sel_types.ColRange(
+                    start=sheet_types.Index(col_bound),
+                    end=sheet_types.Bound(col_end),
+                )),
+            ))
+        if row_end > row_bound:
+            undo.append(Transaction(
+                modification_name="DELETE",
+                input=delete.Input(selection=sel_types.RowRange(
+                    start=sheet_types.Index(row_bound),
+                    end=sheet_types.Bound(row_end),
+                )),
+            ))
+        redo.append(Transaction(
+            modification_name="RESTORE",
+            input=restore.Input(row=row_start, col=col_start, values=buf),
+        ))
+        return redo, undo
+
+    @classmethod
+    def _get_buffer(cls):
         buf = state.get_buffer()
         if buf is None:
             raise err_types.UserError("Nothing in buffer to paste from.")
+        return buf
 
+    # Box the buffer is pasted into, which may be past the bounds.
+    @classmethod
+    def _get_box(cls, target, buf):
         bounds = sheet.data.get_bounds()
         row_bound = bounds.row.value
         col_bound = bounds.col.value
@@ -52,21 +138,4 @@ class Paste(Modification):
             raise err_types.NotSupportedError(
                 f"Selection type, {type(target)}, is not valid for paste."
             )
-
-        ptr = sheet.data.get()
-
-        # insert more rows and columns if needed
-        if row_end > row_bound:
-            number = row_end - row_bound
-            Insert.apply(
-                InsertInput(target=sel_types.RowIndex(row_bound), number=number)
-            )
-        if col_end > col_bound:
-            number = col_end - col_bound
-            Insert.apply(
-                InsertInput(target=sel_types.ColIndex(col_bound), number=number)
-            )
-
-        # update ptr to refer to newly modified sheet
-        ptr = sheet.data.get()
-        ptr[row_start:row_end, col_start:col_end] = buf
+        return row_start, row_end, col_start, col_end
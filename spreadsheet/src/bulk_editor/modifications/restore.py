@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+import numpy as np
+
+import src.sheet as sheet
+
+from src.bulk_editor.modifications.modification import Modification
+from src.bulk_editor.modifications.types import Transaction
+
+
+@dataclass
+class Input:
+    row: int
+    col: int
+    values: np.ndarray
+
+
+# Set the cells of a box starting at the row and column back to values
+# they held, e.g. to undo a modification.
+class Restore(Modification):
+    @classmethod
+    def name(cls):
+        return "RESTORE"
+
+    @classmethod
+    def apply(cls, input: Input):
+        rows, cols = input.values.shape
+        sheet.data.set_region(
+            input.row, input.row + rows, input.col, input.col + cols,
+            input.values,
+        )
+
+    @classmethod
+    def update_computed(cls, input: Input):
+        rows, cols = input.values.shape
+        sheet.update_computed(
+            input.row, input.row + rows, input.col, input.col + cols,
+        )
+        return True
+
+    @classmethod
+    def record(cls, input: Input):
+        redo = [Transaction(modification_name=cls.name(), input=input)]
+        undo = [Transaction(
+            modification_name=cls.name(),
+            input=get_input(input.row, input.col, input.values.shape),
+        )]
+        return redo, undo
+
+
+# Input restoring the cells of the box as they are now.
+def get_input(row, col, shape):
+    rows, cols = shape
+    values = sheet.data.get_region(row, row + rows, col, col + cols)
+    return Input(row=row, col=col, values=values)
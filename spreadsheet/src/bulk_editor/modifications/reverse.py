@@ -4,6 +4,7 @@ import numpy as np
 import src.sheet as sheet
 
 from src.bulk_editor.modifications.modification import Modification
+from src.bulk_editor.modifications.types import Transaction
 
 
 @dataclass
@@ -18,6 +19,12 @@ class Reverse(Modification):
 
     @classmethod
     def apply(cls, input: Input):
-        ptr = sheet.data.get()
+        bounds = sheet.data.get_bounds()
         # reverse rows
-        sheet.data.set(np.flipud(ptr))
+        sheet.data.take_rows(np.arange(bounds.row.value)[::-1])
+
+    # Reversing is its own inverse.
+    @classmethod
+    def record(cls, input: Input):
+        redo = [Transaction(modification_name=cls.name(), input=input)]
+        return redo, redo
@@ -1,15 +1,42 @@
 from dataclasses import dataclass
+import numpy as np
+from typing import List, Optional
 
 import src.errors.types as err_types
 import src.selector.types as sel_types
 import src.sheet as sheet
+import src.sheet.types as sheet_types
 
 from src.bulk_editor.modifications.modification import Modification
+from src.bulk_editor.modifications.types import Transaction
+import src.bulk_editor.modifications.restore as restore
+import src.bulk_editor.modifications.take as take
+
+
+# Rows are sorted by the computed values of the key columns, where
+# empty cells come first, then numbers and booleans, then strings.
+# Each key column is turned into arrays of the type and the rank of its
+# values, so rows are ordered by np.lexsort rather than Python comparisons.
+# Rows with the same keys keep their order.
+@dataclass
+class Key:
+    col: int
+    descending: bool = False
 
 
 @dataclass
 class Input:
-    target: sel_types.ColIndex
+    # Keys in order of priority.
+    keys: List[Key]
+    # Box of cells to sort, or None for the whole sheet.
+    box: Optional[sel_types.Box] = None
+
+
+NONE = 0
+NUMBER = 1
+STRING = 2
+
+numeric_types = (bool, int, float, np.number, np.bool_)
 
 
 class Sort(Modification):
@@ -19,34 +46,167 @@ class Sort(Modification):
 
     @classmethod
     def apply(cls, input: Input):
-        target = input.target
+        row_start, row_end, col_start, col_end = get_box(input)
+        order = get_order(input.keys, row_start, row_end)
 
-        index = None
-        if isinstance(target, sel_types.ColIndex):
-            index = target.value
+        if is_whole_rows(col_start, col_end):
+            sheet.data.take_rows(get_rows(order, row_start))
         else:
-            raise err_types.NotSupportedError(
-                f"Selection type {type(target)} is not valid for sort."
+            values = sheet.data.get_region(row_start, row_end, col_start, col_end)
+            sheet.data.set_region(
+                row_start, row_end, col_start, col_end, values[order],
             )
-        assert index is not None
-
-        ptr = sheet.data.get()
-        order_col = cls._order(ptr[:, index])
-        # sort rows
-        sheet.data.set(ptr[order_col])
 
-    # return array representing order of elements in L
-    # where Nones are first, then numericals, then strings
+    # Sorting whole rows is undone by putting them back in their previous
+    # order, and sorting part of the rows by setting the box back.
     @classmethod
-    def _order(cls, L):
-        L_with_index = [(e, i) for i, e in enumerate(L)]
-        nones = [(e, i) for e, i in L_with_index if e is None]
-        numerical = sorted([
-            (e, i) for e, i in L_with_index
-            if isinstance(e, bool) or isinstance(e, int) or isinstance(e, float)
-        ])
-        strings = sorted([(e, i) for e, i in L_with_index if isinstance(e, str)])
-        final = nones + numerical + strings
-        order_by_index = [i for e, i in final]
-        assert len(order_by_index) == len(L)
-        return order_by_index
+    def record(cls, input: Input):
+        row_start, row_end, col_start, col_end = get_box(input)
+        order = get_order(input.keys, row_start, row_end)
+
+        if is_whole_rows(col_start, col_end):
+            rows = get_rows(order, row_start)
+            redo = [Transaction(
+                modification_name="TAKE", input=take.Input(order=rows),
+            )]
+            undo = [Transaction(
+                modification_name="TAKE",
+                input=take.Input(order=np.argsort(rows)),
+            )]
+            return redo, undo
+
+        shape = (row_end - row_start, col_end - col_start)
+        prev = restore.get_input(row_start, col_start, shape)
+        redo = [Transaction(
+            modification_name="RESTORE",
+            input=restore.Input(
+                row=row_start, col=col_start, values=prev.values[order],
+            ),
+        )]
+        undo = [Transaction(modification_name="RESTORE", input=prev)]
+        return redo, undo
+
+
+def is_whole_rows(col_start, col_end):
+    return col_start == 0 and col_end == sheet.data.get_bounds().col.value
+
+
+# Order of all rows of the sheet given the order of the sorted rows.
+def get_rows(order, row_start):
+    rows = np.arange(sheet.data.get_bounds().row.value)
+    rows[row_start:row_start + len(order)] = row_start + order
+    return rows
+
+
+def get_box(input):
+    bounds = sheet.data.get_bounds()
+    if len(input.keys) == 0:
+        raise err_types.UserError("Sort requires at least one key column.")
+    for key in input.keys:
+        if key.col < 0 or key.col >= bounds.col.value:
+            raise err_types.OutOfBoundsError(
+                f"Sort key column {key.col} is out of bounds."
+            )
+
+    box = input.box
+    if box is None:
+        return 0, bounds.row.value, 0, bounds.col.value
+    if not isinstance(box, sel_types.Box):
+        raise err_types.NotSupportedError(
+            f"Selection type {type(box)} is not valid for sort."
+        )
+    return (
+        box.row_range.start.value,
+        box.row_range.end.value,
+        box.col_range.start.value,
+        box.col_range.end.value,
+    )
+
+
+# Computed values of a column for the rows, with failures as None.
+def get_values(col, row_start, row_end):
+    values, _ = sheet.get_cells_computed(sel_types.Box(
+        row_range=sel_types.RowRange(
+            start=sheet_types.Index(row_start),
+            end=sheet_types.Bound(row_end),
+        ),
+        col_range=sel_types.ColRange(
+            start=sheet_types.Index(col),
+            end=sheet_types.Bound(col + 1),
+        ),
+    ))
+    return values[:, 0]
+
+
+# Arrays of the type and the rank of each value, by which rows are sorted.
+def get_sort_keys(col, row_start, row_end):
+    # Columns of numbers or booleans are ranked by their values as is.
+    typed = sheet.data.get_typed_values(col, row_start, row_end)
+    if typed is not None:
+        return np.full(len(typed), NUMBER, dtype=np.int8), typed
+
+    # Columns of strings without formulas are ranked by their distinct
+    # strings rather than the string of every row.
+    if not sheet.dependencies.get_dynamic(
+        row_start, row_end, col, col + 1,
+    ).any():
+        coded = sheet.data.get_string_codes(col, row_start, row_end)
+        if coded is not None:
+            categories, codes, valid = coded
+            _, category_ranks = np.unique(
+                categories.astype(str), return_inverse=True,
+            )
+            kinds = np.where(valid, STRING, NONE).astype(np.int8)
+            ranks = np.zeros(len(codes), dtype=np.int64)
+            ranks[valid] = category_ranks[codes[valid]]
+            return kinds, ranks
+
+    values = get_values(col, row_start, row_end)
+    kinds = np.full(len(values), NONE, dtype=np.int8)
+
+    is_number = np.frompyfunc(
+        lambda v: isinstance(v, numeric_types), 1, 1,
+    )(values).astype(bool)
+    kinds[is_number] = NUMBER
+    numbers = values[is_number]
+    # Integers are ranked as int64 rather than float64, which cannot
+    # tell apart those above 2**53, and only columns also holding floats
+    # are ranked as floats.
+    is_float = np.frompyfunc(
+        lambda v: isinstance(v, (float, np.floating)), 1, 1,
+    )(numbers).astype(bool)
+    if is_float.any():
+        ranks = np.zeros(len(values), dtype=np.float64)
+        ranks[is_number] = numbers.astype(np.float64)
+    else:
+        ranks = np.zeros(len(values), dtype=np.int64)
+        try:
+            ranks[is_number] = numbers.astype(np.int64)
+        except OverflowError:
+            # Integers beyond int64 are ranked by Python comparisons.
+            _, ranks[is_number] = np.unique(numbers, return_inverse=True)
+
+    is_string = np.frompyfunc(lambda v: isinstance(v, str), 1, 1)(values).astype(bool)
+    kinds[is_string] = STRING
+    if is_string.any():
+        _, string_ranks = np.unique(
+            values[is_string].astype(str), return_inverse=True,
+        )
+        ranks[is_string] = string_ranks
+    return kinds, ranks
+
+
+# Order of the rows, relative to the first row, such that row i of the
+# sorted rows is the row previously at order[i].
+def get_order(keys, row_start, row_end):
+    # np.lexsort sorts by the last array first.
+    arrays = []
+    for key in reversed(keys):
+        kinds, ranks = get_sort_keys(key.col, row_start, row_end)
+        if key.descending:
+            kinds = -kinds
+            # ~ reverses integers without overflowing, unlike -.
+            ranks = -ranks if ranks.dtype.kind == "f" else ~ranks
+        arrays.append(ranks)
+        arrays.append(kinds)
+    return np.lexsort(arrays)
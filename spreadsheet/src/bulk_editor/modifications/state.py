@@ -1,22 +1,19 @@
-import copy
-
-
+# The buffer is a read-only copy of the copied cells, shared by every
+# paste rather than copied for each, as writing it into the sheet
+# copies its values anyway.
+# Cell values are immutable, e.g. numbers and strings, so copying the
+# array, rather than the values in it, keeps the buffer from changing
+# along with the sheet.
 buffer = None
 
 
 def get_buffer():
-    if buffer is None:
-        return buffer
-
-    # Copy objects, e.g. strings, within the array.
-    copied_buffer = copy.deepcopy(buffer)
-    return copied_buffer
+    return buffer
 
 
 def set_buffer(buf):
-    # Assume buf is pointer to desired data.
-    # Copy objects, e.g. strings, within the array.
-    copied_buf = copy.deepcopy(buf)
+    copied_buf = buf.copy()
+    copied_buf.flags.writeable = False
 
     global buffer
     buffer = copied_buf
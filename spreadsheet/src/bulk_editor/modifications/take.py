@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+import numpy as np
+
+import src.sheet as sheet
+
+from src.bulk_editor.modifications.modification import Modification
+from src.bulk_editor.modifications.types import Transaction
+
+
+@dataclass
+class Input:
+    # Row i becomes the row previously at order[i].
+    order: np.ndarray
+
+
+class Take(Modification):
+    @classmethod
+    def name(cls):
+        return "TAKE"
+
+    @classmethod
+    def apply(cls, input: Input):
+        sheet.data.take_rows(input.order)
+
+    @classmethod
+    def record(cls, input: Input):
+        redo = [Transaction(modification_name=cls.name(), input=input)]
+        undo = [Transaction(
+            modification_name=cls.name(),
+            input=Input(order=np.argsort(input.order)),
+        )]
+        return redo, undo
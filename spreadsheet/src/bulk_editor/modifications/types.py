@@ -1,6 +1,14 @@
+from dataclasses import dataclass
 from enum import Enum
+from typing import Any
 
 
 class Axis(Enum):
     ROW = 0
     COLUMN = 1
+
+
+@dataclass
+class Transaction:
+    modification_name: str
+    input: Any
@@ -5,6 +5,8 @@ import src.selector.types as sel_types
 import src.sheet as sheet
 
 from src.bulk_editor.modifications.modification import Modification
+from src.bulk_editor.modifications.types import Transaction
+import src.bulk_editor.modifications.restore as restore
 
 
 @dataclass
@@ -28,5 +30,19 @@ class Value(Modification):
         row_start, row_end, col_start, col_end = \
             sel_helpers.get_bounds_from_selection(sel)
 
-        ptr = sheet.data.get()
-        ptr[row_start:row_end, col_start:col_end] = value
+        sheet.data.set_region(row_start, row_end, col_start, col_end, value)
+
+    @classmethod
+    def record(cls, input: Input):
+        row_start, row_end, col_start, col_end = \
+            sel_helpers.get_bounds_from_selection(input.selection)
+
+        redo = [Transaction(modification_name=cls.name(), input=input)]
+        undo = [Transaction(
+            modification_name="RESTORE",
+            input=restore.get_input(
+                row_start, col_start,
+                (row_end - row_start, col_end - col_start),
+            ),
+        )]
+        return redo, undo
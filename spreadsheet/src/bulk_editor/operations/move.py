@@ -59,7 +59,7 @@ class Move(Operation):
         sel = selection.get(cls.name(), "input")
         sel_checkers.check_selection(sel)
         target = selection.get(cls.name(), "target")
-        sel_types.check_selection(target)
+        sel_checkers.check_selection(target)
 
         num = None
         adjusted_target = None
@@ -92,39 +92,21 @@ class Move(Operation):
         assert num is not None
         assert adjusted_target is not None
 
-        mods = [
-            modifications.Transaction(
-                modification_name="COPY",
-                input=modifications.CopyInput(selection=sel),
-            ),
-            modifications.Transaction(
-                modification_name="DELETE",
-                input=modifications.DeleteInput(selection=sel),
-            ),
-            modifications.Transaction(
-                modification_name="INSERT",
-                input=modifications.InsertInput(target=adjusted_target, number=num),
-            ),
-            modifications.Transaction(
-                modification_name="PASTE",
-                input=modifications.PasteInput(target=adjusted_target),
-            ),
-        ]
-
-        for mod in mods:
-            modifications.apply_transaction(mod)
+        # Rotate the cells into place, leaving the clipboard as it is.
+        modifications.apply_transaction(modifications.Transaction(
+            modification_name="MOVE",
+            input=modifications.MoveInput(selection=sel, target=adjusted_target),
+        ))
 
         # update selection to wherever cells ended up
-        new_start = target.value
+        new_start = adjusted_target.value
         if isinstance(sel, sel_types.RowRange):
-            num = sel.end.value - sel.start.value
             new_sel = sel_types.RowRange(
                 start=sheet_types.Index(new_start),
                 end=sheet_types.Bound(new_start + num),
             )
             sel_state.set_selection(new_sel)
         elif isinstance(sel, sel_types.ColRange):
-            num = sel.end.value - sel.start.value
             new_sel = sel_types.ColRange(
                 start=sheet_types.Index(new_start),
                 end=sheet_types.Bound(new_start + num),
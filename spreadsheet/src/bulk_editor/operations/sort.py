@@ -1,12 +1,16 @@
 from flask import render_template
 
+import src.command_palette as command_palette
 import src.errors.types as err_types
 import src.selector.checkers as sel_checkers
 import src.selector.types as sel_types
+import src.sheet as sheet
+import src.sheet.types as sheet_types
 
 import src.bulk_editor.modifications as modifications
 from src.bulk_editor.operations.operation import Operation
 import src.bulk_editor.operations.selection as selection
+import src.bulk_editor.operations.state as state
 
 
 class Sort(Operation):
@@ -20,14 +24,23 @@ class Sort(Operation):
 
     @classmethod
     def validate_selection(cls, use, sel):
-        if use == "target":
+        if use == "input":
+            sel_type = type(sel)
             selection_type_options = [
-                sel_types.ColIndex,
+                sel_types.RowRange,
+                sel_types.Box,
             ]
-
-            sel = selection.convert_to_target(sel)
+            if sel_type not in selection_type_options:
+                raise err_types.NotSupportedError(
+                    f"Sort operation does not support input selection type {sel_type}."
+                )
+        elif use == "target":
+            # A range of columns gives several keys, from left to right.
+            if not isinstance(sel, sel_types.ColRange) \
+                    or sel.end.value - sel.start.value == 1:
+                sel = selection.convert_to_target(sel)
             target_type = type(sel)
-            if target_type not in selection_type_options:
+            if target_type not in [sel_types.ColIndex, sel_types.ColRange]:
                 raise err_types.NotSupportedError(
                     f"Sort operation does not support target selection type {target_type}."
                 )
@@ -41,17 +54,74 @@ class Sort(Operation):
         target = selection.get(cls.name(), "target")
         sel_checkers.check_selection(target)
 
+        cols = None
+        if isinstance(target, sel_types.ColIndex):
+            cols = [target.value]
+        elif isinstance(target, sel_types.ColRange):
+            cols = list(range(target.start.value, target.end.value))
+        assert cols is not None
+
+        descending = cls._parse_order(form, len(cols))
+        keys = [
+            modifications.SortKey(col=col, descending=desc)
+            for col, desc in zip(cols, descending)
+        ]
+
+        # Sort the input selection if there is one, otherwise the sheet.
+        box = None
+        if "input" in state.get_selections():
+            sel = selection.get(cls.name(), "input")
+            sel_checkers.check_selection(sel)
+            box = sel
+            if isinstance(sel, sel_types.RowRange):
+                bounds = sheet.data.get_bounds()
+                box = sel_types.Box(
+                    row_range=sel,
+                    col_range=sel_types.ColRange(
+                        start=sheet_types.Index(0),
+                        end=sheet_types.Bound(bounds.col.value),
+                    ),
+                )
+
         modifications.apply_transaction(
             modifications.Transaction(
                 modification_name="SORT",
-                input=modifications.SortInput(target=target),
+                input=modifications.SortInput(keys=keys, box=box),
             )
         )
 
+    # Whether each key is descending, from a comma-separated list of
+    # 'asc' or 'desc' for each key, where missing keys are ascending.
+    @classmethod
+    def _parse_order(cls, form, number):
+        order = ""
+        if form is not None and "sort-order" in form:
+            order = form["sort-order"]
+
+        descending = []
+        for word in order.split(","):
+            word = word.strip().lower()
+            if word == "":
+                continue
+            if word not in ["asc", "desc"]:
+                raise err_types.InputError(
+                    f"Field 'order' has value '{word}' rather than 'asc' or 'desc'."
+                )
+            descending.append(word == "desc")
+        if len(descending) > number:
+            raise err_types.InputError(
+                f"Field 'order' gives {len(descending)} orders for {number} keys."
+            )
+        return descending + [False] * (number - len(descending))
+
     @classmethod
     def render(cls):
-        use_sel = selection.render(cls.name(), "target")
+        show_help = command_palette.state.get_show_help()
+        use_sel_input = selection.render(cls.name(), "input")
+        use_sel_target = selection.render(cls.name(), "target")
         return render_template(
                 "partials/bulk_editor/sort.html",
-                use_sel=use_sel,
+                show_help=show_help,
+                use_sel_input=use_sel_input,
+                use_sel_target=use_sel_target,
         )
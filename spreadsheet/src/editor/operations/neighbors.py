@@ -10,7 +10,7 @@ class Neighbors(Operation):
 
     @classmethod
     def template(cls):
-        return "= <R#<ROW>-1:<ROW>-1><C#<COL>-1:<COL>> + <R#<ROW>-1:<ROW>><C#<COL>+1:<COL>+1> + <R#<ROW>+1:<ROW>+1><C#<COL>:<COL>+1> + <R#<ROW>:<ROW>+1><C#<COL>-1:<COL>-1>"
+        return "=CONCAT(<R#<ROW>-1:<ROW>-1><C#<COL>-1:<COL>>, <R#<ROW>-1:<ROW>><C#<COL>+1:<COL>+1>, <R#<ROW>+1:<ROW>+1><C#<COL>:<COL>+1>, <R#<ROW>:<ROW>+1><C#<COL>-1:<COL>-1>)"
 
     @classmethod
     def render(cls):
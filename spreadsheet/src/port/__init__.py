@@ -16,6 +16,7 @@ def render_cell(
 
 
 def render(catch_failure=False):
+    sheet.sync_bounds()
     upperleft = viewer.state.get_upperleft()
     nrows, ncols = viewer.state.get_dimensions()
     bounds = sheet.data.get_bounds()
@@ -1,4 +1,7 @@
 from flask import render_template
+import functools
+
+from settings import Settings
 
 import src.sheet as sheet
 import src.editor as editor
@@ -9,6 +12,40 @@ import src.selector.state as sel_state
 import src.selector.types as sel_types
 
 
+# Rendered cells and headers are cached by everything they are rendered
+# from, so rendering a cell whose value and render classes have not
+# changed, e.g. when moving the port back and forth, skips its template.
+# Editing or selecting cells changes their values or render classes and
+# so their keys, rather than invalidating what was cached.
+@functools.lru_cache(maxsize=Settings.FRAGMENT_CACHE_SIZE)
+def render_cell_template(
+    row, col, editing, markdown, data, data_type, data_repr, renders,
+    input_render,
+):
+    # The type and repr of the data are only part of the key, as e.g.
+    # 1, 1.0 and True or 0.0 and -0.0 are equal but rendered differently.
+    return render_template(
+            "partials/port/cell.html",
+            row=row,
+            col=col,
+            editing=editing,
+            markdown=markdown,
+            data=data,
+            renders=renders,
+            input_render=input_render,
+    )
+
+
+@functools.lru_cache(maxsize=Settings.FRAGMENT_CACHE_SIZE)
+def render_header_template(template, index, renders):
+    return render_template(
+        template,
+        index=index,
+        data=index if index is not None else "",
+        renders=renders,
+    )
+
+
 def make_render_selected():
     sel = sel_state.get_selection()
 
@@ -111,16 +148,23 @@ def render_cell(
     row = cell_position.row_index.value
     col = cell_position.col_index.value
 
-    return render_template(
-            "partials/port/cell.html",
-            row=row,
-            col=col,
-            editing=editing,
-            markdown=markdown,
-            data=value,
-            renders=renders,
-            input_render=input_render if input_render is not None else '',
+    args = (
+        row,
+        col,
+        editing,
+        markdown,
+        value,
+        type(value),
+        repr(value),
+        tuple(renders),
+        input_render if input_render is not None else '',
     )
+    try:
+        hash(args)
+    except TypeError:
+        # Values that cannot be hashed, e.g. arrays, are not cached.
+        return render_cell_template.__wrapped__(*args)
+    return render_cell_template(*args)
 
 
 def render_corner_header(render_selected=None):
@@ -135,10 +179,8 @@ def render_corner_header(render_selected=None):
     render_selected_state = render_selected(cell_position)
     renders.append(render_selected_state)
 
-    return render_template(
-        "partials/port/corner_header.html",
-        data="",
-        renders=renders,
+    return render_header_template(
+        "partials/port/corner_header.html", None, tuple(renders),
     )
 
 
@@ -154,11 +196,8 @@ def render_row_header(row_index, render_selected=None):
     render_selected_state = render_selected(cell_position)
     renders.append(render_selected_state)
 
-    return render_template(
-        "partials/port/row_header.html",
-        index=row_index.value,
-        data=row_index.value,
-        renders=renders,
+    return render_header_template(
+        "partials/port/row_header.html", row_index.value, tuple(renders),
     )
 
 
@@ -174,11 +213,8 @@ def render_col_header(col_index, render_selected=None):
     render_selected_state = render_selected(cell_position)
     renders.append(render_selected_state)
 
-    return render_template(
-        "partials/port/col_header.html",
-        index=col_index.value,
-        data=col_index.value,
-        renders=renders,
+    return render_header_template(
+        "partials/port/col_header.html", col_index.value, tuple(renders),
     )
 
 
@@ -1,19 +1,27 @@
 from flask import render_template
+import itertools
+
+from settings import Settings
 
 import src.sheet as sheet
+import src.sheet.text_index as text_index
 
 
-text = ""
+query = text_index.Query(text="")
 
 
-def set_text(_text):
-    global text
-    text = _text
+def set_query(text, case_sensitive, regex):
+    global query
+    query = text_index.Query(
+        text=text,
+        case_sensitive=case_sensitive,
+        regex=regex,
+    )
 
 
-def reset_text():
-    global text
-    text = ""
+def reset_query():
+    global query
+    query = text_index.Query(text="")
 
 
 def render_result(row, col, value):
@@ -25,26 +33,44 @@ def render_result(row, col, value):
     )
 
 
-def render_results():
-    if text == "":
+def render_more(row, col):
+    return render_template(
+            "partials/selector/search/more.html",
+            row=row,
+            col=col,
+    )
+
+
+# Render a page of results starting from the (row, col) position,
+# so the search resumes from where the last page ended.
+# If there are more results, the page ends with a button to render
+# the next page, starting from the first result not rendered.
+def render_results(start=(0, 0)):
+    if query.text == "":
         return ""
 
-    results = sheet.get_cells_containing_text(text)
+    results = sheet.get_cells_containing_text(query, start)
+    page_size = Settings.SEARCH_PAGE_SIZE
+    # Take one more than the page to know if there are more results.
+    page = list(itertools.islice(results, page_size + 1))
 
     entries = []
-    for p in results:
+    for p, value in page[:page_size]:
         row = p.row_index.value
         col = p.col_index.value
-        value = sheet.get_cell_computed(p)
         result_html = render_result(row, col, value)
         entries.append(result_html)
 
+    if len(page) > page_size:
+        p, _ = page[page_size]
+        entries.append(render_more(p.row_index.value, p.col_index.value))
+
     return "\n".join(entries)
 
 
 def render():
     # reset upon re-render
-    reset_text()
+    reset_query()
     results = render_results()
 
     return render_template(
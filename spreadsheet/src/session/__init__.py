@@ -21,9 +21,17 @@ import src.viewer as viewer
 class Session:
     def __init__(self, path, debug):
         self.path = path
-        sheet.files.setup(path, debug)
+        from_snapshot = sheet.files.setup(path, debug)
+        bulk_editor.modifications.journal.init()
+        if Settings.RECALC_EAGERLY:
+            sheet.recalculate()
+        if not from_snapshot:
+            sheet.files.take_snapshot()
 
         notifications.state.init()
+        load_message = sheet.files.get_load_message()
+        if load_message is not None:
+            notifications.state.set_info(load_message)
 
     def add_event(self, resp, event):
         if 'HX-Trigger' not in resp.headers:
@@ -75,6 +83,7 @@ class Session:
 
     def render_body_helper(self, resp):
         dark_mode = Settings.DARK_MODE
+        autosave_interval = Settings.AUTOSAVE_INTERVAL
         show_command_palette = command_palette.state.get_show()
         show_help = command_palette.state.get_show_help()
 
@@ -87,6 +96,7 @@ class Session:
         body_html = render_template(
                 "partials/body.html",
                 dark_mode=dark_mode,
+                autosave_interval=autosave_interval,
                 null=null,
                 notification_banner=notification_html,
                 command_palette=command_palette_html,
@@ -136,9 +146,14 @@ class Session:
     def render_notification(self, id):
         resp = Response()
 
-        # If we are on same notification, clear.
+        # If a save finished, show how it went. While saving, keep showing
+        # that it is, as info notifications are fetched again until cleared.
+        # Otherwise, if we are on same notification, clear.
         curr_id = notifications.state.get_id()
-        if id == curr_id:
+        results = sheet.files.pop_save_results()
+        if len(results) > 0:
+            self.notify_save_results(resp, results)
+        elif id == curr_id and not sheet.files.is_saving():
             self.reset_notifications(resp)
 
         notification_html = notifications.render()
@@ -155,12 +170,66 @@ class Session:
         resp.set_data(body_html)
         return resp
 
+    def notify_save_results(self, resp, results):
+        failed = [result for result in results if result.error is not None]
+        if len(failed) > 0:
+            self.notify_error(
+                resp, f"Could not save file: {failed[-1].error}",
+            )
+        else:
+            self.notify_info(
+                resp, f"Saved file in {results[-1].elapsed:.2f}s.",
+            )
+
     def save(self):
         resp = Response()
 
-        sheet.files.save()
+        if sheet.files.save():
+            self.notify_info(resp, "Saving file...")
+        else:
+            self.notify_info(resp, "No changes to save.")
+
+        null_html = self.render_null_helper()
+        resp.set_data(null_html)
+        return resp
+
+    def autosave(self):
+        resp = Response()
 
-        self.notify_info(resp, "Saved file.")
+        if sheet.files.save():
+            self.notify_info(resp, "Autosaving file...")
+
+        null_html = self.render_null_helper()
+        resp.set_data(null_html)
+        return resp
+
+    def undo(self):
+        resp = Response()
+
+        try:
+            bulk_editor.undo()
+            self.notify_info(resp, "Undid last modification.")
+            self.add_event(resp, "update-port")
+            # update selector in case selection is out of bounds
+            self.add_event(resp, "selector")
+        except err_types.UserError as e:
+            self.notify_error(resp, e)
+
+        null_html = self.render_null_helper()
+        resp.set_data(null_html)
+        return resp
+
+    def redo(self):
+        resp = Response()
+
+        try:
+            bulk_editor.redo()
+            self.notify_info(resp, "Redid last modification.")
+            self.add_event(resp, "update-port")
+            # update selector in case selection is out of bounds
+            self.add_event(resp, "selector")
+        except err_types.UserError as e:
+            self.notify_error(resp, e)
 
         null_html = self.render_null_helper()
         resp.set_data(null_html)
@@ -211,11 +280,9 @@ class Session:
 
     def update_cell_helper(self, resp, cell_position, value):
         try:
-            sheet.update_cell_value(cell_position, value)
-            dep_cells = sheet.get_potential_dependents()
+            bulk_editor.update_cell_value(cell_position, value)
+            dep_cells = sheet.get_viewable_dependents(cell_position)
             for dc in dep_cells:
-                if dc == cell_position:
-                    continue
                 row = dc.row_index.value
                 col = dc.col_index.value
                 self.add_event(resp, f"cell-{row}-{col}")
@@ -291,12 +358,23 @@ class Session:
         # Update showing viewer target feature.
         self.add_event(resp, "viewer-target")
 
-    def update_search_results(self, text):
+    def update_search_results(self, text, case_sensitive, regex):
         resp = Response()
 
-        selector.search.set_text(text)
+        selector.search.set_query(text, case_sensitive, regex)
+
+        try:
+            search_results_html = selector.search.render_results()
+        except err_types.UserError as e:
+            search_results_html = ""
+            self.notify_error(resp, e)
+        resp.set_data(search_results_html)
+        return resp
+
+    def render_more_search_results(self, start):
+        resp = Response()
 
-        search_results_html = selector.search.render_results()
+        search_results_html = selector.search.render_results(start)
         resp.set_data(search_results_html)
         return resp
 
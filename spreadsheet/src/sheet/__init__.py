@@ -1,43 +1,48 @@
 import numpy as np
 
+from settings import Settings
+
 import src.errors.types as err_types
 import src.viewer as viewer
 import src.selector.checkers as sel_checkers
 import src.selector.types as sel_types
 
+import src.sheet.cache as cache
 import src.sheet.compiler as compiler
 import src.sheet.data as sheet_data
+import src.sheet.dependencies as dependencies
 import src.sheet.files as files
 import src.sheet.graph as graph
+import src.sheet.masks as masks
+import src.sheet.recalc as recalc
+import src.sheet.text_index as text_index
 import src.sheet.types as types
 
 
 # This dynamically computes cells when they are in view or are updated.
 # In computing a cell, we therefore always compute its dependencies.
+# Computed values are cached alongside the sheet, so fetching a cell
+# that has been computed before is a lookup.
+#
 # In updating a cell, we must recompute its dependents, which are
-# likely to have different values. Since our current sheet data structure,
-# a numpy array of underlying values, does not easily allow for computation
-# of dependents, we just end up recomputing all viewable cells that are
-# likely to depend on the updated cell, or all viewable formulas.
+# likely to have different values. We maintain the DAG of formula
+# dependencies from when the sheet is loaded, so we only invalidate the
+# updated cell and the cells that transitively depend on it,
+# and only refresh those dependents that are in view.
+# Bulk modifications can move cells around, so they rebuild the DAG
+# and drop the whole cache. Those that append empty rows or columns or
+# write a small box of cells in place only update what they change.
+#
+# Search looks up cells by the trigrams of their computed values,
+# re-indexing only the cells changed since the last search.
 #
-# This method is therefore not efficient for a sheet with lots of
-# computationally-expensive, deeply nested, multi-dependency formulas.
-# However, we are operating under the assumption that this tool will
-# mainly be used for managing tabular data and simple formulas.
-# Given a reasonably sized port, fetches should still have minimal latency.
+# References to a range of cells are kept as boxes in the DAG and
+# passed to formulas as numpy arrays, rather than expanded into every cell.
 #
-# If this assumption changes, we can consider using a data structure,
-# like an array of objects that store the underlying value, pointers
-# to the dependencies, pointers to the  dependents, and computed value.
-# This data structure has the following advantages:
-# - caching of cell values, allowing fetches to be fast,
-# - more efficient updating of the DAG of cell dependencies when a single
-#   cell or group of cells change,
-# - efficient modification to the sheet when inserting or deleting rows
-#   and columns.
-# Initialization of the cache can take place when first importing the
-# spreadsheet or at the time of load, the latter likely being better
-# if the spreadsheet is large and complicated.
+# Computing every cell, e.g. to search the sheet, is done in one pass
+# over the cells yet to be computed rather than cell by cell.
+# Independent formulas are evaluated on a pool of processes when there
+# are enough of them.
 
 
 def is_markdown(cell_position):
@@ -45,80 +50,215 @@ def is_markdown(cell_position):
     return graph.is_markdown(underlying_value)
 
 
+def reset_computed():
+    cache.init()
+    dependencies.init()
+    text_index.init()
+    if Settings.RECALC_EAGERLY:
+        recalculate()
+
+
+def invalidate(cell_positions):
+    cache.invalidate(cell_positions)
+    text_index.mark_stale([
+        (pos.row_index.value, pos.col_index.value) for pos in cell_positions
+    ])
+    if Settings.RECALC_EAGERLY:
+        recalculate()
+
+
+# Empty rows (axis 0) or columns (axis 1) were appended to the sheet.
+# Cells have not moved, so only formulas whose references may now read
+# the new cells are compiled again.
+def extend_computed(axis, number):
+    bounds = sheet_data.get_bounds()
+    bound = (bounds.row.value, bounds.col.value)[axis] - number
+
+    cache.grow(axis, number)
+    dependencies.grow(axis, number)
+    text_index.grow(axis)
+
+    changed = [
+        graph.to_position(key)
+        for key in dependencies.get_bound_readers(axis, bound)
+    ]
+    dependents = []
+    for cell_position in changed:
+        dependencies.update(cell_position)
+        dependents += dependencies.get_dependents(cell_position)
+    invalidate(changed + dependents)
+
+
+# Cells of a box were written in place, e.g. pasted.
+# Large boxes are recomputed from scratch as updating each cell would
+# take longer.
+def update_computed(row_start, row_end, col_start, col_end):
+    ncells = (row_end - row_start) * (col_end - col_start)
+    if ncells >= Settings.RESET_COMPUTED_THRESHOLD:
+        reset_computed()
+        return
+
+    changed = [
+        graph.to_position((row, col))
+        for row in range(row_start, row_end)
+        for col in range(col_start, col_end)
+    ]
+    for cell_position in changed:
+        dependencies.update(cell_position)
+    invalidate(changed + dependencies.get_box_dependents(
+        row_start, row_end, col_start, col_end,
+    ))
+
+
+# A lazily opened file grows as its rows are found,
+# after which everything is recomputed for the new bounds.
+def sync_bounds():
+    if sheet_data.refresh_bounds():
+        reset_computed()
+
+
+# Compute all cells that have yet to be computed.
+def recalculate():
+    bounds = sheet_data.get_bounds()
+    sheet_data.load_rows(0, bounds.row.value)
+    keys = [
+        (int(row), int(col))
+        for row, col in masks.get_cells(dependencies.dynamic, cache.valid)
+    ]
+    recalc.recalculate(keys)
+
+
 def get_cell_computed(cell_position):
     value = graph.compute(cell_position)
     return value
 
 
+# Computed values of a box of cells, computing those that have yet to be
+# in one pass. Cells that failed to compute are None in the values and
+# marked in the failure mask.
+def get_cells_computed(box):
+    region = (
+        box.row_range.start.value,
+        box.row_range.end.value,
+        box.col_range.start.value,
+        box.col_range.end.value,
+    )
+    row_start = box.row_range.start.value
+    col_start = box.col_range.start.value
+
+    dynamic = dependencies.get_dynamic(*region)
+    pending = dynamic & ~cache.get_valid(*region)
+    recalc.recalculate([
+        (int(row_start + row), int(col_start + col))
+        for row, col in np.argwhere(pending)
+    ])
+
+    failed = dynamic & cache.get_failed(*region)
+    computed = dynamic & ~failed
+
+    values = sheet_data.get_region(*region)
+    for row, col in np.argwhere(computed):
+        values[row, col] = cache.computed[(row_start + row, col_start + col)]
+    values[failed] = None
+    return values, failed
+
+
 def get_all_cells_computed():
     bounds = sheet_data.get_bounds()
-    data = np.empty((bounds.row.value, bounds.col.value), dtype=object)
-    for row in range(bounds.row.value):
-        for col in range(bounds.col.value):
-            data[row, col] = get_cell_computed(sel_types.CellPosition(
-                row_index=sel_types.RowIndex(int(row)),
-                col_index=sel_types.ColIndex(int(col)),
-            ))
-    return data
-
-
-def get_cells_containing_text(text):
-    relevant = []
-
-    computed_data = get_all_cells_computed()
-    for row in range(computed_data.shape[0]):
-        for col in range(computed_data.shape[1]):
-            computed = computed_data[row, col]
-            if isinstance(computed, str) and text in computed:
-                pos = sel_types.CellPosition(
-                    row_index=sel_types.RowIndex(int(row)),
-                    col_index=sel_types.ColIndex(int(col)),
-                )
-                relevant.append(pos)
-    return relevant
-
-
-def get_potential_dependents():
-    upperleft = viewer.state.get_upperleft()
-    nrows, ncols = viewer.state.get_dimensions()
-    bounds = sheet_data.get_bounds()
+    return get_cells_computed(sel_types.Box(
+        row_range=sel_types.RowRange(
+            start=sel_types.RowIndex(0),
+            end=bounds.row,
+        ),
+        col_range=sel_types.ColRange(
+            start=sel_types.ColIndex(0),
+            end=bounds.col,
+        ),
+    ))
+
+
+# Computed value of a computed cell, or None if it failed.
+def get_cached_value(key):
+    if not dependencies.is_dynamic(key):
+        return sheet_data.get_cell_value(graph.to_position(key))
+    if cache.is_failed(graph.to_position(key)):
+        return None
+    return cache.computed[key]
+
 
-    viewable_formulas = []
-    for row in range(
-        upperleft.row_index.value,
-        min(upperleft.row_index.value+nrows, bounds.row.value)
+# Computed values of the sheet in boxes that may hold values,
+# as their first row and column and their values.
+def get_computed_blocks():
+    bounds = sheet_data.get_bounds()
+    for row, col, values in sheet_data.get_blocks(
+        0, bounds.row.value, 0, bounds.col.value,
     ):
-        for col in range(
-            upperleft.col_index.value,
-            min(upperleft.col_index.value+ncols, bounds.col.value)
-        ):
-            cell_position = sel_types.CellPosition(
-                row_index=sel_types.RowIndex(row),
-                col_index=sel_types.ColIndex(col),
-            )
-            value = sheet_data.get_cell_value(cell_position)
-            if graph.is_formula(value):
-                viewable_formulas.append(cell_position)
-    return viewable_formulas
+        rows, cols = values.shape
+        computed_values, _ = get_cells_computed(sel_types.Box(
+            row_range=sel_types.RowRange(
+                start=sel_types.RowIndex(row),
+                end=sel_types.RowIndex(row + rows),
+            ),
+            col_range=sel_types.ColRange(
+                start=sel_types.ColIndex(col),
+                end=sel_types.ColIndex(col + cols),
+            ),
+        ))
+        yield row, col, computed_values
+
+
+def refresh_text_index():
+    if not text_index.is_built():
+        text_index.build(
+            get_computed_blocks(), sheet_data.get_bounds().row.value,
+        )
+        return
+
+    keys = text_index.pop_stale()
+    recalc.recalculate([key for key in keys if graph.needs_compute(key)])
+    for key in keys:
+        text_index.update(key, get_cached_value(key))
+
+
+# Cells at or after the (row, col) position whose computed value matches
+# the query, along with the value. Matches are found as they are consumed.
+def get_cells_containing_text(query, start=(0, 0)):
+    refresh_text_index()
+    return (
+        (graph.to_position(key), value)
+        for key, value in text_index.search(query, start)
+    )
+
+
+def get_viewable_dependents(cell_position):
+    return [
+        dep for dep in dependencies.get_dependents(cell_position)
+        if viewer.in_view(dep)
+    ]
 
 
 def update_cell_value(cell_position, value):
     sel_checkers.check_cell_position(cell_position)
-    ptr = sheet_data.get()
 
-    prev_value = ptr[
-        cell_position.row_index.value, cell_position.col_index.value
-    ]
+    prev_value = sheet_data.get_cell_value(cell_position)
 
     compiled_value = compiler.user_string_to_value(value)
-    ptr[cell_position.row_index.value, cell_position.col_index.value] = compiled_value
+    sheet_data.set_cell_value(cell_position, compiled_value)
+    dependencies.update(cell_position)
+    changed = [cell_position] + dependencies.get_dependents(cell_position)
+    cache.invalidate(changed)
+    text_index.mark_stale([
+        (pos.row_index.value, pos.col_index.value) for pos in changed
+    ])
 
     # Determine if new value is valid.
     # If not, rollback to previous value.
     try:
         graph.compute(cell_position)
     except err_types.UserError as e:
-        ptr[
-            cell_position.row_index.value, cell_position.col_index.value
-        ] = prev_value
+        sheet_data.set_cell_value(cell_position, prev_value)
+        dependencies.update(cell_position)
+        cache.invalidate(
+            [cell_position] + dependencies.get_dependents(cell_position)
+        )
         raise e
@@ -0,0 +1,95 @@
+from typing import Any, Dict, Tuple
+
+import src.sheet.masks as masks
+
+
+# Computed values of cells, parallel to the sheet's underlying values.
+# An entry is only meaningful if the cell is marked as valid.
+# Failures are cached as well, as the error raised when computing the cell,
+# so that a broken formula is not re-evaluated on every render.
+# Only cells that are computed have a value, so values are kept by
+# (row, col) rather than in an array the size of the sheet.
+# Cells that are valid or failed are kept as masks of the sheet.
+computed: Dict[Tuple[int, int], Any] = {}
+valid = None
+failed = None
+
+def init():
+    global computed, valid, failed
+
+    computed = {}
+    valid = masks.new()
+    failed = masks.new()
+
+
+def grow(axis, number):
+    global valid, failed
+    valid = masks.grow(valid, axis, number)
+    failed = masks.grow(failed, axis, number)
+
+
+# Set the computed values of the cells at the (row, col) keys.
+def restore(keys, values):
+    init()
+    computed.update(zip(map(tuple, keys.tolist()), values))
+    masks.set_cells(valid, keys, True)
+
+
+def is_valid(cell_position):
+    return masks.get(
+        valid, cell_position.row_index.value, cell_position.col_index.value,
+    )
+
+
+def is_failed(cell_position):
+    return masks.get(
+        failed, cell_position.row_index.value, cell_position.col_index.value,
+    )
+
+
+def get_valid(row_start, row_end, col_start, col_end):
+    return masks.get_region(valid, row_start, row_end, col_start, col_end)
+
+
+def get_failed(row_start, row_end, col_start, col_end):
+    return masks.get_region(failed, row_start, row_end, col_start, col_end)
+
+
+def get_value(cell_position):
+    row = cell_position.row_index.value
+    col = cell_position.col_index.value
+    assert masks.get(valid, row, col)
+
+    if masks.get(failed, row, col):
+        # Drop the traceback of the original failure
+        # so it does not grow every time it is raised.
+        raise computed[(row, col)].with_traceback(None)
+    return computed[(row, col)]
+
+
+def set_value(cell_position, value):
+    row = cell_position.row_index.value
+    col = cell_position.col_index.value
+
+    computed[(row, col)] = value
+    masks.set(valid, row, col, True)
+    masks.set(failed, row, col, False)
+
+
+def set_failure(cell_position, error):
+    row = cell_position.row_index.value
+    col = cell_position.col_index.value
+
+    computed[(row, col)] = error
+    masks.set(valid, row, col, True)
+    masks.set(failed, row, col, True)
+
+
+def invalidate(cell_positions):
+    for cell_position in cell_positions:
+        row = cell_position.row_index.value
+        col = cell_position.col_index.value
+
+        computed.pop((row, col), None)
+        masks.set(valid, row, col, False)
+        masks.set(failed, row, col, False)
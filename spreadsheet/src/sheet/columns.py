@@ -0,0 +1,270 @@
+from dataclasses import dataclass
+from enum import Enum
+import numpy as np
+from typing import Dict, Optional
+
+
+# Storage of a column of the sheet as a typed block.
+# Integers, floats and booleans are stored in arrays of their type and
+# strings are dictionary-encoded as codes into the column's distinct strings.
+# Columns of mixed types fall back to an array of objects.
+# Empty cells are marked in a validity mask rather than stored as None.
+class Kind(Enum):
+    INT = "int"
+    FLOAT = "float"
+    BOOL = "bool"
+    STRING = "string"
+    OBJECT = "object"
+
+
+dtypes = {
+    Kind.INT: np.int64,
+    Kind.FLOAT: np.float64,
+    Kind.BOOL: np.bool_,
+    Kind.STRING: np.int32,
+    Kind.OBJECT: object,
+}
+
+kinds = {
+    int: Kind.INT,
+    float: Kind.FLOAT,
+    bool: Kind.BOOL,
+    str: Kind.STRING,
+}
+
+
+@dataclass
+class Column:
+    kind: Kind
+    values: np.ndarray
+    valid: np.ndarray
+    # Distinct strings of a string column, indexed by the codes in values.
+    categories: Optional[np.ndarray] = None
+    # Code of each distinct string, built when strings are first written.
+    codes: Optional[Dict[str, int]] = None
+
+
+def is_valid(values):
+    return np.not_equal(values, None)
+
+
+# Kind of a column holding the given values, none of which are empty.
+def infer_kind(values):
+    types = set(map(type, values))
+    if len(types) != 1:
+        return Kind.OBJECT
+    kind = kinds.get(types.pop(), Kind.OBJECT)
+
+    if kind == Kind.INT:
+        try:
+            values.astype(np.int64)
+        except OverflowError:
+            return Kind.OBJECT
+    return kind
+
+
+def empty(nrows):
+    # Empty columns are string columns as most cells are strings.
+    return Column(
+        kind=Kind.STRING,
+        values=np.zeros(nrows, dtype=np.int32),
+        valid=np.zeros(nrows, dtype=bool),
+        categories=np.array([], dtype=object),
+    )
+
+
+def from_values(values):
+    valid = is_valid(values)
+    present = values[valid]
+    kind = infer_kind(present) if len(present) > 0 else Kind.STRING
+
+    if kind == Kind.OBJECT:
+        return Column(kind=kind, values=values.copy(), valid=valid)
+
+    column = Column(
+        kind=kind,
+        values=np.zeros(len(values), dtype=dtypes[kind]),
+        valid=valid,
+    )
+    if kind == Kind.STRING:
+        categories, codes = np.unique(present, return_inverse=True)
+        column.categories = categories.astype(object)
+        column.values[valid] = codes
+    else:
+        column.values[valid] = present.astype(dtypes[kind])
+    return column
+
+
+def to_values(column, rows=slice(None)):
+    if column.kind == Kind.OBJECT:
+        return column.values[rows].copy()
+
+    valid = column.valid[rows]
+    values = np.empty(len(valid), dtype=object)
+    present = column.values[rows][valid]
+    if column.kind == Kind.STRING:
+        values[valid] = column.categories[present]
+    else:
+        # Converts to Python values.
+        values[valid] = present
+    return values
+
+
+def get_value(column, row):
+    if not column.valid[row]:
+        return None
+    if column.kind == Kind.OBJECT:
+        return column.values[row]
+    if column.kind == Kind.STRING:
+        return column.categories[column.values[row]]
+    return column.values[row].item()
+
+
+def encode(column, strings):
+    if column.codes is None:
+        column.codes = {s: i for i, s in enumerate(column.categories)}
+
+    new = []
+    encoded = np.empty(len(strings), dtype=np.int32)
+    for i, s in enumerate(strings):
+        code = column.codes.get(s)
+        if code is None:
+            code = len(column.codes)
+            column.codes[s] = code
+            new.append(s)
+        encoded[i] = code
+
+    if len(new) > 0:
+        column.categories = np.concatenate([
+            column.categories, np.array(new, dtype=object),
+        ])
+    return encoded
+
+
+# Write values to the rows at the indices, returning the column to use
+# from then on, which is re-encoded if the values do not fit its kind.
+def write(column, rows, values):
+    valid = is_valid(values)
+    present = values[valid]
+
+    if column.kind == Kind.OBJECT:
+        column.values[rows] = values
+        column.valid[rows] = valid
+        return column
+
+    if len(present) > 0 and infer_kind(present) != column.kind:
+        all_values = to_values(column)
+        all_values[rows] = values
+        return from_values(all_values)
+
+    if column.kind == Kind.STRING:
+        present = encode(column, present)
+    column.values[rows[valid]] = present
+    column.values[rows[~valid]] = 0
+    column.valid[rows] = valid
+    return column
+
+
+# Empty the rows at the indices.
+def clear(column, rows):
+    column.values[rows] = None if column.kind == Kind.OBJECT else 0
+    column.valid[rows] = False
+
+
+# Grow the column to the number of rows, the new rows being empty.
+def resize(column, nrows):
+    extra = nrows - len(column.valid)
+    fill = np.zeros(extra, dtype=column.values.dtype)
+    if column.kind == Kind.OBJECT:
+        fill = np.full(extra, None, dtype=object)
+    return Column(
+        kind=column.kind,
+        values=np.concatenate([column.values, fill]),
+        valid=np.concatenate([column.valid, np.zeros(extra, dtype=bool)]),
+        categories=column.categories,
+        codes=column.codes,
+    )
+
+
+def take(column, rows):
+    return Column(
+        kind=column.kind,
+        values=column.values[rows],
+        valid=column.valid[rows],
+        categories=column.categories,
+        codes=column.codes,
+    )
+
+
+# Join columns end to end, e.g. parts of a column parsed separately.
+# Parts of the same kind are joined without converting their values.
+def concatenate(parts):
+    kinds = {part.kind for part in parts if part.valid.any()}
+    if len(kinds) > 1 or Kind.OBJECT in kinds:
+        return from_values(np.concatenate([to_values(part) for part in parts]))
+    kind = kinds.pop() if len(kinds) > 0 else Kind.STRING
+
+    valid = np.concatenate([part.valid for part in parts])
+    if kind != Kind.STRING:
+        values = np.concatenate([
+            part.values if part.kind == kind
+            else np.zeros(len(part.valid), dtype=dtypes[kind])
+            for part in parts
+        ])
+        return Column(kind=kind, values=values, valid=valid)
+
+    # Merge the distinct strings of the parts and recode each part.
+    strings = [part for part in parts if part.kind == Kind.STRING]
+    categories, inverse = np.unique(
+        np.concatenate([part.categories for part in strings]),
+        return_inverse=True,
+    )
+    codes = []
+    offset = 0
+    for part in parts:
+        if part.kind != Kind.STRING or len(part.categories) == 0:
+            codes.append(np.zeros(len(part.valid), dtype=np.int32))
+            continue
+        recode = inverse[offset:offset + len(part.categories)].astype(np.int32)
+        offset += len(part.categories)
+        codes.append(np.where(part.valid, recode[part.values], 0).astype(np.int32))
+    return Column(
+        kind=kind,
+        values=np.concatenate(codes),
+        valid=valid,
+        categories=categories.astype(object),
+    )
+
+
+# Mask of the cells holding a string for which the predicate holds.
+# The predicate is only applied once per distinct string.
+def get_string_mask(column, predicate):
+    if column.kind == Kind.OBJECT:
+        return np.frompyfunc(
+            lambda v: isinstance(v, str) and predicate(v), 1, 1,
+        )(column.values).astype(bool)
+    if column.kind != Kind.STRING or len(column.categories) == 0:
+        return np.zeros(len(column.valid), dtype=bool)
+
+    holds = np.array([predicate(s) for s in column.categories], dtype=bool)
+    return column.valid & holds[column.values]
+
+
+# Distinct strings of a string column, with the codes and validity
+# of the rows into them. The rows are a slice or indices.
+def get_codes(column, rows):
+    if column.kind != Kind.STRING:
+        return None
+    return column.categories, column.values[rows], column.valid[rows]
+
+
+# Values of the rows as a typed array, if they are all numbers or
+# booleans. The rows are a slice, for a view, or indices, for a copy.
+def get_typed_values(column, rows):
+    if column.kind not in (Kind.INT, Kind.FLOAT, Kind.BOOL):
+        return None
+    if not column.valid[rows].all():
+        return None
+    values = column.values[rows].view()
+    values.flags.writeable = False
+    return values
@@ -1,7 +1,19 @@
-# Regex-based compiler of macros.
-
+# Single-pass compiler of macros.
+#
+# A formula is parsed once into text and references to cells,
+# which are then compiled for the position of each cell using it.
+# Bounds of references that are integer arithmetic on <ROW> and <COL>,
+# e.g. <R#<ROW>-1>, are folded into functions of the cell position.
+# Other bounds are evaluated as Python expressions.
+
+from dataclasses import dataclass
+import functools
+import operator
 import re
-from typing import List
+from types import CodeType
+from typing import Callable, List, Optional
+
+from settings import Settings
 
 import src.errors.types as err_types
 import src.selector.checkers as sel_checkers
@@ -10,18 +22,28 @@ import src.sheet.data as sheet_data
 import src.sheet.types as sheet_types
 
 
-num_regex = r"[0-9]+"
-expression_regex = r"[^\<\>\n\r]+"
+arithmetic_regex = re.compile(r"(?:\s*(?:[0-9]+|<ROW>|<COL>|//|[-+*%()]))*\s*")
+arithmetic_token_regex = re.compile(r"[0-9]+|<ROW>|<COL>|//|[-+*%()]")
+arithmetic_operators = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "//": operator.floordiv,
+    "%": operator.mod,
+}
 
 
 class Node:
     def __init__(self, formula, dependencies):
         self.formula: str = formula
-        self.dependencies: List[sel_types.CellPosition] = dependencies
+        # Value of each dependency is bound to its register.
+        self.dependencies: List[sel_types.CellPosition | sel_types.Box] = \
+            dependencies
+        self.code: Optional[CodeType] = None
 
-    def add_dependency(self, position):
+    def add_dependency(self, selection):
         index = len(self.dependencies)
-        self.dependencies.append(position)
+        self.dependencies.append(selection)
         return index
 
     def get_dependency(self, index):
@@ -29,6 +51,12 @@ class Node:
         return self.dependencies[index]
 
 
+# Name of the variable the value of a dependency is bound to
+# when evaluating a compiled formula.
+def register(index):
+    return f"EVAL_{index}"
+
+
 # For compile-time evaluations, i.e. whatever is in macro.
 def evaluate(cell_position, expression):
     try:
@@ -44,308 +72,250 @@ def evaluate(cell_position, expression):
     return value
 
 
-def replace_instances(formula, instances, replace_instance):
-    offset = 0
-    for instance in instances:
-        value = replace_instance(instance)
-
-        start_index = instance.start(0) + offset
-        end_index = instance.end(0) + offset
-        formula = formula[:start_index] + value + formula[end_index:]
-
-        value_len = len(value)
-        orig_len = end_index - start_index
-        offset += value_len - orig_len
-
-    return formula
+# Fold integer arithmetic on <ROW> and <COL> into a constant
+# or a function of the row and column.
+# Returns None if the expression is anything else.
+def fold_arithmetic(source):
+    if arithmetic_regex.fullmatch(source) is None:
+        return None
+    tokens = arithmetic_token_regex.findall(source)
+    index = 0
+
+    def peek():
+        return tokens[index] if index < len(tokens) else None
+
+    def take():
+        nonlocal index
+        index += 1
+        return tokens[index - 1]
+
+    def combine(op, a, b):
+        if isinstance(a, int) and isinstance(b, int):
+            return op(a, b)
+        fa = a if callable(a) else (lambda row, col: a)
+        fb = b if callable(b) else (lambda row, col: b)
+        return lambda row, col: op(fa(row, col), fb(row, col))
+
+    def factor():
+        token = take() if peek() is not None else None
+        if token is None:
+            raise ValueError()
+        elif token == "-":
+            return combine(operator.sub, 0, factor())
+        elif token == "+":
+            return factor()
+        elif token == "<ROW>":
+            return lambda row, col: row
+        elif token == "<COL>":
+            return lambda row, col: col
+        elif token == "(":
+            value = expression()
+            if peek() != ")":
+                raise ValueError()
+            take()
+            return value
+        elif token.isdigit():
+            return int(token)
+        raise ValueError()
+
+    def term():
+        value = factor()
+        while peek() in ["*", "//", "%"]:
+            op = arithmetic_operators[take()]
+            value = combine(op, value, factor())
+        return value
+
+    def expression():
+        value = term()
+        while peek() in ["+", "-"]:
+            op = arithmetic_operators[take()]
+            value = combine(op, value, term())
+        return value
 
+    try:
+        value = expression()
+    except (ValueError, ZeroDivisionError):
+        return None
+    if index != len(tokens):
+        return None
+    return value
 
-def position_references(cell_position, node):
-    formula = node.formula
 
-    curr_row_instances = re.finditer(r"\<ROW\>", formula)
+class Expression:
+    def __init__(self, source):
+        self.source: str = source
+        self.fold: Optional[int | Callable[[int, int], int]] = \
+            fold_arithmetic(source)
 
-    def curr_row_replace(instance):
+    def evaluate(self, cell_position):
         row = cell_position.row_index.value
-        compiled = f"{row}"
-        return compiled
-
-    formula = replace_instances(formula, curr_row_instances, curr_row_replace)
-
-    curr_col_instances = re.finditer(r"\<COL\>", formula)
-
-    def curr_col_replace(instance):
         col = cell_position.col_index.value
-        compiled = f"{col}"
-        return compiled
-
-    formula = replace_instances(formula, curr_col_instances, curr_col_replace)
-
-    node.formula = formula
-    return node
-
-
-def get_row_range_positions(sel):
-    sel = sel_checkers.check_and_set_row_range(sel)
-    bounds = sheet_data.get_bounds()
 
-    pos = []
-    for i in range(sel.start.value, sel.end.value):
-        for j in range(0, bounds.col.value):
-            pos.append(sel_types.CellPosition(
-                row_index=sel_types.RowIndex(i),
-                col_index=sel_types.ColIndex(j),
-            ))
-    return pos
-
-
-def get_col_range_positions(sel):
-    sel = sel_checkers.check_and_set_col_range(sel)
-    bounds = sheet_data.get_bounds()
-
-    pos = []
-    for i in range(0, bounds.row.value):
-        for j in range(sel.start.value, sel.end.value):
-            pos.append(sel_types.CellPosition(
-                row_index=sel_types.RowIndex(i),
-                col_index=sel_types.ColIndex(j),
-            ))
-    return pos
-
-
-def get_box_positions(sel):
-    sel = sel_checkers.check_and_set_box(sel)
-
-    pos = []
-    for i in range(sel.row_range.start.value, sel.row_range.end.value):
-        for j in range(sel.col_range.start.value, sel.col_range.end.value):
-            pos.append(sel_types.CellPosition(
-                row_index=sel_types.RowIndex(i),
-                col_index=sel_types.ColIndex(j),
-            ))
-    return pos
-
-
-def selections(cell_position, node):
-    formula = node.formula
+        if isinstance(self.fold, int):
+            return self.fold
+        if self.fold is not None:
+            try:
+                return self.fold(row, col)
+            except ZeroDivisionError:
+                # report error from evaluation below
+                pass
+
+        expression = self.source \
+            .replace("<ROW>", f"{row}") \
+            .replace("<COL>", f"{col}")
+        return evaluate(cell_position, expression)
+
+
+# Inclusive span of rows or columns, e.g. the "<ROW>-1:<ROW>+1" in <R#...>.
+@dataclass
+class Span:
+    start: Expression
+    # None if span is a single index
+    end: Optional[Expression]
+
+    def evaluate(self, cell_position):
+        start = self.start.evaluate(cell_position)
+        end = start if self.end is None else self.end.evaluate(cell_position)
+        # make exclusive
+        return start, end + 1
+
+
+# <ROW> or <COL> outside of a reference.
+@dataclass
+class PositionReference:
+    axis: str
+
+
+# <R#...>, <C#...>, or <R#...><C#...>.
+@dataclass
+class Reference:
+    rows: Optional[Span]
+    cols: Optional[Span]
+
+    def is_cell(self):
+        return self.rows is not None and self.rows.end is None \
+            and self.cols is not None and self.cols.end is None
+
+
+def parse_span(formula, start):
+    index = start
+    while index < len(formula):
+        c = formula[index]
+        if c == ">":
+            break
+        elif c == "<":
+            if formula.startswith("<ROW>", index) \
+                    or formula.startswith("<COL>", index):
+                index += len("<ROW>")
+                continue
+            return None
+        elif c in "\n\r":
+            return None
+        index += 1
+    else:
+        return None
 
-    # Compute box before row range and col range so compile properly.
     # expressions should not have :
-    box_instances = re.finditer(
-            r"\<R#"
-            + r"(?P<row_start>{}):".format(expression_regex)
-            + r"(?P<row_end>{})".format(expression_regex)
-            + r"\>"
-            + r"\<C#"
-            + r"(?P<col_start>{}):".format(expression_regex)
-            + r"(?P<col_end>{})".format(expression_regex)
-            + r"\>",
-            formula,
-            )
-
-    def box_replace(instance):
-        row_start = evaluate(cell_position, instance.group("row_start"))
-        row_end = evaluate(cell_position, instance.group("row_end"))
-        col_start = evaluate(cell_position, instance.group("col_start"))
-        col_end = evaluate(cell_position, instance.group("col_end"))
-        sel = sel_types.Box(
-            row_range=sel_types.RowRange(
-                start=sheet_types.Index(row_start),
-                # make exclusive
-                end=sheet_types.Bound(row_end+1),
-            ),
-            col_range=sel_types.ColRange(
-                start=sheet_types.Index(col_start),
-                # make exclusive
-                end=sheet_types.Bound(col_end+1),
-            ),
-        )
-        pos = get_box_positions(sel)
-
-        expr_arr = []
-        for p in pos:
-            r = node.add_dependency(p)
-            expr = f"EVAL<{r}>"
-            expr_arr.append(expr)
-        compiled = "[{}]".format(",".join(expr_arr))
-
-        return compiled
-
-    formula = replace_instances(
-        formula,
-        box_instances,
-        box_replace,
-    )
-
-    # Compute cell before row index and col index so compile properly.
-    cell_instances = re.finditer(
-            r"\<R#"
-            + r"(?P<row>{})".format(expression_regex)
-            + r"\>"
-            + r"\<C#"
-            + r"(?P<col>{})".format(expression_regex)
-            + r"\>",
-            formula,
-            )
-
-    def cell_replace(instance):
-        row = evaluate(cell_position, instance.group("row"))
-        col = evaluate(cell_position, instance.group("col"))
-        sel = sel_types.Box(
-            row_range=sel_types.RowRange(
-                start=sheet_types.Index(row),
-                end=sheet_types.Bound(row+1),
-            ),
-            col_range=sel_types.ColRange(
-                start=sheet_types.Index(col),
-                end=sheet_types.Bound(col+1),
-            ),
+    body = formula[start:index]
+    sep = body.rfind(":")
+    if sep == -1:
+        if body == "":
+            return None
+        span = Span(start=Expression(body), end=None)
+    else:
+        if sep == 0 or sep == len(body) - 1:
+            return None
+        span = Span(
+            start=Expression(body[:sep]),
+            end=Expression(body[sep+1:]),
         )
-        pos = get_box_positions(sel)
-
-        assert len(pos) == 1
-        p = pos[0]
-        r = node.add_dependency(p)
-        compiled = f"EVAL<{r}>"
-
-        return compiled
-
-    formula = replace_instances(
-        formula,
-        cell_instances,
-        cell_replace,
-    )
-
-    # expressions should not have :
-    row_range_instances = re.finditer(
-            r"\<R#"
-            + r"(?P<row_start>{}):".format(expression_regex)
-            + r"(?P<row_end>{})".format(expression_regex)
-            + r"\>",
-            formula,
-            )
-
-    def row_range_replace(instance):
-        row_start = evaluate(cell_position, instance.group("row_start"))
-        row_end = evaluate(cell_position, instance.group("row_end"))
-        sel = sel_types.RowRange(
+    return span, index + 1
+
+
+def parse_macro(formula, start):
+    if formula.startswith("<ROW>", start):
+        return PositionReference("ROW"), start + len("<ROW>")
+    if formula.startswith("<COL>", start):
+        return PositionReference("COL"), start + len("<COL>")
+
+    if formula.startswith("<R#", start):
+        parsed = parse_span(formula, start + len("<R#"))
+        if parsed is None:
+            return None, start
+        rows, end = parsed
+
+        cols = None
+        if formula.startswith("<C#", end):
+            parsed = parse_span(formula, end + len("<C#"))
+            if parsed is not None:
+                cols, end = parsed
+        return Reference(rows=rows, cols=cols), end
+
+    if formula.startswith("<C#", start):
+        parsed = parse_span(formula, start + len("<C#"))
+        if parsed is None:
+            return None, start
+        cols, end = parsed
+        return Reference(rows=None, cols=cols), end
+
+    return None, start
+
+
+# Split formula into text and macros in one pass.
+# Anything that is not a well-formed macro is left as text.
+@functools.lru_cache(maxsize=Settings.FORMULA_CACHE_SIZE)
+def parse(formula):
+    parts = []
+    text_start = 0
+    index = formula.find("<")
+    while index != -1:
+        part, end = parse_macro(formula, index)
+        if part is None:
+            index = formula.find("<", index + 1)
+            continue
+
+        if text_start < index:
+            parts.append(formula[text_start:index])
+        parts.append(part)
+        text_start = end
+        index = formula.find("<", end)
+
+    if text_start < len(formula):
+        parts.append(formula[text_start:])
+    return tuple(parts)
+
+
+# Dependencies are either a single cell or a box of cells.
+# Row and column references are boxes spanning the sheet.
+def compile_reference(cell_position, node, reference):
+    row_range = sel_types.RowRange(start=None, end=None)
+    if reference.rows is not None:
+        row_start, row_end = reference.rows.evaluate(cell_position)
+        row_range = sel_types.RowRange(
             start=sheet_types.Index(row_start),
-            # make exclusive
-            end=sheet_types.Bound(row_end+1),
+            end=sheet_types.Bound(row_end),
         )
-        pos = get_row_range_positions(sel)
-
-        expr_arr = []
-        for p in pos:
-            r = node.add_dependency(p)
-            expr = f"EVAL<{r}>"
-            expr_arr.append(expr)
-        compiled = "[{}]".format(",".join(expr_arr))
-
-        return compiled
-
-    formula = replace_instances(
-        formula,
-        row_range_instances,
-        row_range_replace,
-    )
-
-    row_instances = re.finditer(
-            r"\<R#"
-            + r"(?P<row>{})".format(expression_regex)
-            + r"\>",
-            formula,
-            )
-
-    def row_replace(instance):
-        row = evaluate(cell_position, instance.group("row"))
-        sel = sel_types.RowRange(
-            start=sheet_types.Index(row),
-            end=sheet_types.Bound(row+1),
-        )
-        pos = get_row_range_positions(sel)
-
-        expr_arr = []
-        for p in pos:
-            r = node.add_dependency(p)
-            expr = f"EVAL<{r}>"
-            expr_arr.append(expr)
-        compiled = "[{}]".format(",".join(expr_arr))
-
-        return compiled
 
-    formula = replace_instances(
-        formula,
-        row_instances,
-        row_replace,
-    )
-
-    # expressions should not have :
-    col_range_instances = re.finditer(
-            r"\<C#"
-            + r"(?P<col_start>{}):".format(expression_regex)
-            + r"(?P<col_end>{})".format(expression_regex)
-            + r"\>",
-            formula,
-            )
-
-    def col_range_replace(instance):
-        col_start = evaluate(cell_position, instance.group("col_start"))
-        col_end = evaluate(cell_position, instance.group("col_end"))
-        sel = sel_types.ColRange(
+    col_range = sel_types.ColRange(start=None, end=None)
+    if reference.cols is not None:
+        col_start, col_end = reference.cols.evaluate(cell_position)
+        col_range = sel_types.ColRange(
             start=sheet_types.Index(col_start),
-            # make exclusive
-            end=sheet_types.Bound(col_end+1),
+            end=sheet_types.Bound(col_end),
         )
-        pos = get_col_range_positions(sel)
-
-        expr_arr = []
-        for p in pos:
-            r = node.add_dependency(p)
-            expr = f"EVAL<{r}>"
-            expr_arr.append(expr)
-        compiled = "[{}]".format(",".join(expr_arr))
-
-        return compiled
 
-    formula = replace_instances(
-        formula,
-        col_range_instances,
-        col_range_replace,
+    sel = sel_checkers.check_and_set_box(
+        sel_types.Box(row_range=row_range, col_range=col_range)
     )
 
-    col_instances = re.finditer(
-            r"\<C#"
-            + r"(?P<col>{})".format(expression_regex)
-            + r"\>",
-            formula,
-            )
-
-    def col_replace(instance):
-        col = evaluate(cell_position, instance.group("col"))
-        sel = sel_types.ColRange(
-            start=sheet_types.Index(col),
-            end=sheet_types.Bound(col+1),
+    if reference.is_cell():
+        sel = sel_types.CellPosition(
+            row_index=sel_types.RowIndex(sel.row_range.start.value),
+            col_index=sel_types.ColIndex(sel.col_range.start.value),
         )
-        pos = get_col_range_positions(sel)
 
-        expr_arr = []
-        for p in pos:
-            r = node.add_dependency(p)
-            expr = f"EVAL<{r}>"
-            expr_arr.append(expr)
-        compiled = "[{}]".format(",".join(expr_arr))
-
-        return compiled
-
-    formula = replace_instances(
-        formula,
-        col_instances,
-        col_replace,
-    )
-
-    node.formula = formula
-    return node
+    r = node.add_dependency(sel)
+    return register(r)
 
 
 # Cast user string to basic value if possible.
@@ -375,30 +345,68 @@ def user_string_to_value(value):
     return value
 
 
-# Cast Python value to representation in Python code.
-def value_to_code(value):
-    if value == None:
-        return "None"
-    elif isinstance(value, int):
-        return f"{value}"
-    elif isinstance(value, float):
-        return f"{value}"
-    elif value == True:
-        return "True"
-    elif value == False:
-        return "False"
-    else: # treat as string
-        return f"\"{value}\""
-
-
 # Compilation before DAG-evaluation.
 def pre_compile(cell_position, formula):
     node = Node(formula=formula, dependencies=[])
-    node = position_references(cell_position, node)
-    node = selections(cell_position, node)
+
+    compiled = []
+    for part in parse(formula):
+        if isinstance(part, str):
+            compiled.append(part)
+        elif isinstance(part, PositionReference):
+            if part.axis == "ROW":
+                compiled.append(f"{cell_position.row_index.value}")
+            else:
+                compiled.append(f"{cell_position.col_index.value}")
+        else:
+            compiled.append(compile_reference(cell_position, node, part))
+
+    node.formula = "".join(compiled)
     return node
 
 
-# Compilation after DAG-evaluation.
+# Compilation after macros are expanded.
 def post_compile(cell_position, formula):
     return formula
+
+
+# Compiled source is also cached on its own since recalculation workers
+# compile from source, and formulas of different cells often share it.
+@functools.lru_cache(maxsize=Settings.FORMULA_CACHE_SIZE)
+def compile_source(source):
+    return compile(source, "<formula>", "eval")
+
+
+# Compiled formulas are cached as they are evaluated every time a
+# dependency changes. The sheet bounds are part of the key since
+# row and column references span the bounds of the sheet.
+@functools.lru_cache(maxsize=Settings.FORMULA_CACHE_SIZE)
+def compile_cached(formula, row, col, nrows, ncols):
+    cell_position = sel_types.CellPosition(
+        row_index=sel_types.RowIndex(row),
+        col_index=sel_types.ColIndex(col),
+    )
+
+    node = pre_compile(cell_position, formula)
+    node.formula = post_compile(cell_position, node.formula)
+    try:
+        node.code = compile_source(node.formula)
+    except SyntaxError as e:
+        raise err_types.UserError(
+            "Compilation of formula at cell position "
+            f"({row}, {col}) "
+            f"encountered error: {e}.\n"
+            f"Compiled formula: {node.formula}"
+        )
+    return node
+
+
+def compile_formula(cell_position, formula):
+    bounds = sheet_data.get_bounds()
+    return compile_cached(
+        formula,
+        cell_position.row_index.value,
+        cell_position.col_index.value,
+        bounds.row.value,
+        bounds.col.value,
+    )
@@ -1,39 +1,377 @@
 import numpy as np
+from typing import List
 
 from settings import Settings
 
+import src.sheet.columns as columns
+import src.sheet.lazy as lazy
+import src.sheet.sparse as sparse
 import src.sheet.types as types
 
 
-sheet = None
+# The sheet is stored column by column, each column as a typed block.
+# get and set convert from and to a single array of Python values,
+# so the other functions should be used to read and write parts of it.
+#
+# Rows of the sheet are mapped to rows of the columns, so inserting,
+# deleting and reordering rows only updates the map rather than every
+# column. Columns have spare rows, including the rows of deleted rows,
+# for inserted rows to use, and double in size when they run out.
+# The map has spare room too, so appending rows is amortized constant
+# time. The list of columns is itself the map of columns.
+#
+# A large file may instead be opened lazily, in which case cells are read
+# from the file as needed and edits are kept aside. Modifications other
+# than editing cells load the whole file into columns first.
+#
+# A large sheet that is mostly empty is instead stored sparsely, in tiles.
+sheet: List[columns.Column] = []
+nrows = 0
+# Row of the columns for each row of the sheet, in its first nrows.
+row_map = np.zeros(0, dtype=np.int64)
+# Rows of the columns not used by any row of the sheet.
+free_rows = np.zeros(0, dtype=np.int64)
+capacity = 0
+# First row that differs from the file as last loaded or saved,
+# or None if no row does.
+dirty_row = None
+
+# Rows of the boxes that get_blocks splits a box into, if not sparse.
+BLOCK_ROWS = 4096
 
 
 def get_bounds():
-    shape = sheet.shape
-    return types.Bounds(row=types.Bound(shape[0]), col=types.Bound(shape[1]))
+    if lazy.is_open():
+        rows, cols = lazy.get_shape()
+        return types.Bounds(row=types.Bound(rows), col=types.Bound(cols))
+    if sparse.is_open():
+        rows, cols = sparse.get_shape()
+        return types.Bounds(row=types.Bound(rows), col=types.Bound(cols))
+    return types.Bounds(row=types.Bound(nrows), col=types.Bound(len(sheet)))
+
+
+def get_dirty_row():
+    return dirty_row
+
+
+def mark_dirty(row):
+    global dirty_row
+    dirty_row = row if dirty_row is None else min(dirty_row, row)
+
+
+def mark_clean():
+    global dirty_row
+    dirty_row = None
+
+
+def is_lazy():
+    return lazy.is_open()
+
+
+def is_sparse():
+    return sparse.is_open()
+
+
+def open_lazily(path):
+    lazy.open_file(path)
+
+
+# Update the bounds of a lazily opened file to the rows found so far,
+# returning whether they changed.
+def refresh_bounds():
+    return lazy.is_open() and lazy.refresh()
 
 
+# Parse rows of a lazily opened file that have yet to be.
+def load_rows(row_start, row_end):
+    if lazy.is_open():
+        lazy.load_rows(row_start, row_end)
+
+
+def set_load_listener(listener):
+    lazy.set_listener(listener)
+
+
+def materialize():
+    if lazy.is_open():
+        set(lazy.get_all())
+
+
+# Copy of the sheet as an array of Python values.
 def get():
-    return sheet
+    if lazy.is_open():
+        return lazy.get_all()
+    if sparse.is_open():
+        return sparse.get_all()
+    data = np.empty((nrows, len(sheet)), dtype=object)
+    for col, column in enumerate(sheet):
+        data[:, col] = columns.to_values(column, row_map[:nrows])
+    return data
+
+
+# Whether a sheet of the values is large and empty enough
+# to store sparsely.
+def is_sparse_enough(data):
+    if data.size < Settings.SPARSE_MIN_CELLS:
+        return False
+    used = np.count_nonzero(columns.is_valid(data))
+    return used <= Settings.SPARSE_MAX_DENSITY * data.size
 
 
 def set(data):
-    global sheet
-    sheet = data
+    if is_sparse_enough(data):
+        set_columns([], 0)
+        sparse.open_values(data)
+        return
+    set_columns(
+        [columns.from_values(data[:, col]) for col in range(data.shape[1])],
+        data.shape[0],
+    )
+
+
+# Set the sheet to columns already in typed blocks, of the given rows.
+def set_columns(cols, rows):
+    global sheet, nrows, row_map, free_rows, capacity
+    lazy.close()
+    sparse.close()
+    nrows = rows
+    sheet = cols
+    row_map = np.arange(rows, dtype=np.int64)
+    free_rows = np.zeros(0, dtype=np.int64)
+    capacity = rows
+
+
+# Columns with only the rows of the sheet, in order.
+def get_columns():
+    return [columns.take(column, row_map[:nrows]) for column in sheet]
 
 
 def get_cell_value(cell_position):
-    return sheet[cell_position.row_index.value, cell_position.col_index.value]
+    if lazy.is_open():
+        return lazy.get_value(
+            cell_position.row_index.value,
+            cell_position.col_index.value,
+        )
+    if sparse.is_open():
+        return sparse.get_value(
+            cell_position.row_index.value,
+            cell_position.col_index.value,
+        )
+    return columns.get_value(
+        sheet[cell_position.col_index.value],
+        row_map[cell_position.row_index.value],
+    )
 
 
-def init(debug=False):
+def set_cell_value(cell_position, value):
+    row = cell_position.row_index.value
+    col = cell_position.col_index.value
+    if lazy.is_open():
+        lazy.set_value(row, col, value)
+        mark_dirty(row)
+        return
+    set_region(row, row + 1, col, col + 1, value)
+
+
+# Copy of a box of the sheet as an array of Python values.
+def get_region(row_start, row_end, col_start, col_end):
+    if lazy.is_open():
+        return lazy.get_region(row_start, row_end, col_start, col_end)
+    if sparse.is_open():
+        return sparse.get_region(row_start, row_end, col_start, col_end)
+    data = np.empty((row_end - row_start, col_end - col_start), dtype=object)
+    for col in range(col_start, col_end):
+        data[:, col - col_start] = columns.to_values(
+            sheet[col], row_map[row_start:row_end],
+        )
+    return data
+
+
+# Set a box of the sheet to an array of values of the same shape,
+# or to a single value.
+def set_region(row_start, row_end, col_start, col_end, values):
+    materialize()
+    shape = (row_end - row_start, col_end - col_start)
+    if isinstance(values, np.ndarray):
+        assert values.shape == shape
+    else:
+        values = np.full(shape, values, dtype=object)
+    mark_dirty(row_start)
+
+    if sparse.is_open():
+        sparse.set_region(row_start, row_end, col_start, col_end, values)
+        return
+    rows = row_map[row_start:row_end]
+    for col in range(col_start, col_end):
+        sheet[col] = columns.write(sheet[col], rows, values[:, col - col_start])
+
+
+# Values of part of a column as a typed array, if they are all
+# numbers or booleans, otherwise None.
+def get_typed_values(col, row_start, row_end):
+    if lazy.is_open() or sparse.is_open():
+        return None
+    rows = row_map[row_start:row_end]
+    if len(rows) > 0 and (np.diff(rows) == 1).all():
+        # The rows are together in the column, so give a view of them.
+        rows = slice(rows[0], rows[-1] + 1)
+    return columns.get_typed_values(sheet[col], rows)
+
+
+# Distinct strings of part of a column, with the codes of the rows
+# into them and whether the rows hold a string, if the column is
+# a string column, otherwise None.
+def get_string_codes(col, row_start, row_end):
+    if lazy.is_open() or sparse.is_open():
+        return None
+    return columns.get_codes(sheet[col], row_map[row_start:row_end])
+
+
+# Mask of the cells holding a string for which the predicate holds.
+def get_string_mask(predicate):
+    materialize()
+    if sparse.is_open():
+        return sparse.get_string_mask(predicate)
+    mask = np.zeros((nrows, len(sheet)), dtype=bool)
+    rows = row_map[:nrows]
+    for col, column in enumerate(sheet):
+        mask[:, col] = columns.get_string_mask(column, predicate)[rows]
+    return mask
+
+
+# Boxes within a box that may hold values, as their first row and column
+# and their values, in order of rows. Empty tiles of a sparse sheet
+# are skipped, and otherwise the box is split into bands of rows.
+def get_blocks(row_start, row_end, col_start, col_end):
+    if sparse.is_open():
+        yield from sparse.get_blocks(row_start, row_end, col_start, col_end)
+        return
+    for start in range(row_start, row_end, BLOCK_ROWS):
+        end = min(start + BLOCK_ROWS, row_end)
+        yield start, col_start, get_region(start, end, col_start, col_end)
+
+
+# Copy of rows of the sheet, as arrays of values for bands of rows,
+# which for a sparse sheet are made as they are iterated.
+def copy_rows(row_start, row_end):
+    if sparse.is_open():
+        return sparse.copy_rows(row_start, row_end)
+    return [get_region(row_start, row_end, 0, get_bounds().col.value)]
+
+
+# Rows of the columns for new rows, cleared, growing the columns
+# if there are not enough spare rows.
+def allocate_rows(number):
+    global sheet, free_rows, capacity
+    if number > len(free_rows):
+        grown = max(2 * capacity, capacity + number)
+        sheet = [columns.resize(column, grown) for column in sheet]
+        free_rows = np.concatenate([
+            free_rows, np.arange(capacity, grown, dtype=np.int64),
+        ])
+        capacity = grown
+
+    rows = free_rows[:number]
+    free_rows = free_rows[number:]
+    for column in sheet:
+        columns.clear(column, rows)
+    return rows
+
+
+# Insert empty rows (axis 0) or columns (axis 1) before the index.
+def insert(axis, index, number):
+    global nrows, row_map
+    materialize()
+    if sparse.is_open():
+        sparse.insert(axis, index, number)
+        mark_dirty(index if axis == 0 else 0)
+        return
+    if axis == 0:
+        if nrows + number > len(row_map):
+            grown = np.zeros(
+                max(2 * len(row_map), nrows + number), dtype=np.int64,
+            )
+            grown[:nrows] = row_map[:nrows]
+            row_map = grown
+        # Shift the rows after the index, of which there are none
+        # when appending.
+        row_map[index + number:nrows + number] = row_map[index:nrows]
+        row_map[index:index + number] = allocate_rows(number)
+        nrows += number
+        mark_dirty(index)
+    else:
+        mark_dirty(0)
+        for _ in range(number):
+            sheet.insert(index, columns.empty(capacity))
+
+
+# Delete rows (axis 0) or columns (axis 1) at the indices.
+def delete(axis, indices):
+    global sheet, nrows, free_rows
+    materialize()
+    removed = np.unique(indices)
+    if sparse.is_open():
+        sparse.delete(axis, removed)
+        mark_dirty(int(removed[0]) if axis == 0 else 0)
+        return
+    if axis == 0:
+        free_rows = np.concatenate([free_rows, row_map[removed]])
+        kept = np.delete(row_map[:nrows], removed)
+        row_map[:len(kept)] = kept
+        nrows = len(kept)
+        mark_dirty(int(removed[0]))
+    else:
+        mark_dirty(0)
+        sheet = [
+            column for col, column in enumerate(sheet)
+            if col not in removed
+        ]
+
+
+# Reorder rows such that row i is the row previously at rows[i].
+def take_rows(rows):
+    materialize()
+    if sparse.is_open():
+        sparse.take_rows(rows)
+    else:
+        row_map[:nrows] = row_map[:nrows][rows]
+    moved = np.flatnonzero(np.asarray(rows) != np.arange(len(rows)))
+    if len(moved) > 0:
+        mark_dirty(int(moved[0]))
+
+
+# Move rows (axis 0) or columns (axis 1) from start to end so they
+# begin at the target, as counted once they are taken out, by rotating
+# the rows or columns between where they were and where they go.
+def move(axis, start, end, target):
     global sheet
+    materialize()
+    low = min(start, target)
+    high = max(end, target + end - start)
+    shift = target - start
+    if sparse.is_open():
+        sparse.move(axis, low, high, shift)
+    elif axis == 0:
+        row_map[low:high] = np.roll(row_map[low:high], shift)
+    else:
+        span = sheet[low:high]
+        shift %= len(span)
+        sheet[low:high] = span[len(span) - shift:] + span[:len(span) - shift]
+    mark_dirty(low if axis == 0 else 0)
 
+
+def init(debug=False):
     maxrows = Settings.DIM_SHEET_ROWS
     maxcols = Settings.DIM_SHEET_COLS
 
-    sheet = np.empty((maxrows, maxcols), dtype=object)
+    if not debug and maxrows * maxcols >= Settings.SPARSE_MIN_CELLS:
+        set_columns([], 0)
+        sparse.open_empty(maxrows, maxcols)
+        return
+
+    data = np.empty((maxrows, maxcols), dtype=object)
     if debug:
         for row in range(maxrows):
             for col in range(maxcols):
-                sheet[row, col] = row*maxcols + col
+                data[row, col] = row*maxcols + col
+    set(data)
@@ -0,0 +1,291 @@
+import numpy as np
+from typing import Dict, List, Set, Tuple
+
+import src.errors.types as err_types
+import src.selector.types as sel_types
+
+import src.sheet.compiler as compiler
+import src.sheet.data as sheet_data
+import src.sheet.graph as graph
+import src.sheet.masks as masks
+
+
+# DAG of formula dependencies, keyed by (row, col).
+# Precedents are the cells a formula reads and
+# dependents are the formulas that read a cell.
+# Boxes a formula reads, as (row start, row end, col start, col end),
+# are kept as is rather than expanded into every cell in the box.
+precedents: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+dependents: Dict[Tuple[int, int], Set[Tuple[int, int]]] = {}
+boxes: Dict[Tuple[int, int], List[Tuple[int, int, int, int]]] = {}
+
+# All boxes as an array along with the formula reading each,
+# so formulas reading a cell through a box are found in one pass.
+# Rebuilt on demand after boxes change.
+box_bounds = None
+box_readers: List[Tuple[int, int]] = []
+
+# Formulas reading cells past the bounds of the sheet,
+# which may read cells once the sheet grows.
+out_of_bounds: Set[Tuple[int, int]] = set()
+
+# Cells whose computed value differs from their underlying value,
+# i.e. formulas and markdown, as a mask of the sheet.
+dynamic = None
+
+
+def is_dynamic_value(underlying_value):
+    return graph.is_formula(underlying_value) \
+        or graph.is_markdown(underlying_value)
+
+
+def compile_precedents(cell_position, underlying_value):
+    if not graph.is_formula(underlying_value):
+        return [], []
+
+    formula = underlying_value.removeprefix("=")
+    try:
+        node = compiler.compile_formula(cell_position, formula)
+    except err_types.OutOfBoundsError:
+        out_of_bounds.add(
+            (cell_position.row_index.value, cell_position.col_index.value)
+        )
+        return [], []
+    except err_types.UserError:
+        # The formula fails before reading any cells,
+        # which is reported when it is computed.
+        return [], []
+
+    cell_precedents = []
+    cell_boxes = []
+    for dep in node.dependencies:
+        if isinstance(dep, sel_types.CellPosition):
+            cell_precedents.append((dep.row_index.value, dep.col_index.value))
+        else:
+            cell_boxes.append((
+                dep.row_range.start.value,
+                dep.row_range.end.value,
+                dep.col_range.start.value,
+                dep.col_range.end.value,
+            ))
+    return cell_precedents, cell_boxes
+
+
+def remove(key):
+    global box_bounds
+
+    for p in precedents.pop(key, []):
+        deps = dependents.get(p)
+        if deps is not None:
+            deps.discard(key)
+            if len(deps) == 0:
+                del dependents[p]
+
+    if boxes.pop(key, None) is not None:
+        box_bounds = None
+    out_of_bounds.discard(key)
+
+
+def add(key, cell_precedents, cell_boxes):
+    global box_bounds
+
+    if len(cell_precedents) > 0:
+        precedents[key] = cell_precedents
+        for p in cell_precedents:
+            if p not in dependents:
+                dependents[p] = set()
+            dependents[p].add(key)
+
+    if len(cell_boxes) > 0:
+        boxes[key] = cell_boxes
+        box_bounds = None
+
+
+def get_box_index():
+    global box_bounds, box_readers
+
+    if box_bounds is None:
+        box_readers = []
+        bounds = []
+        for key, cell_boxes in boxes.items():
+            for box in cell_boxes:
+                box_readers.append(key)
+                bounds.append(box)
+        box_bounds = np.array(bounds, dtype=np.int64).reshape(-1, 4)
+
+    return box_bounds, box_readers
+
+
+def get_direct_dependents(key):
+    found = set(dependents.get(key, ()))
+
+    bounds, readers = get_box_index()
+    if len(readers) > 0:
+        row, col = key
+        within = (bounds[:, 0] <= row) & (row < bounds[:, 1]) \
+            & (bounds[:, 2] <= col) & (col < bounds[:, 3])
+        for i in np.flatnonzero(within):
+            found.add(readers[i])
+
+    return found
+
+
+def update(cell_position):
+    row = cell_position.row_index.value
+    col = cell_position.col_index.value
+    underlying_value = sheet_data.get_cell_value(cell_position)
+
+    remove((row, col))
+    add((row, col), *compile_precedents(cell_position, underlying_value))
+    masks.set(dynamic, row, col, is_dynamic_value(underlying_value))
+
+
+# Cells that transitively depend on the given cells through their
+# direct dependents, not including the given cells themselves.
+def find_dependents(starts, direct):
+    found = set(direct) - starts
+    stack = list(found)
+    while len(stack) > 0:
+        key = stack.pop()
+        for dep in get_direct_dependents(key):
+            if dep not in found and dep not in starts:
+                found.add(dep)
+                stack.append(dep)
+
+    return [
+        sel_types.CellPosition(
+            row_index=sel_types.RowIndex(row),
+            col_index=sel_types.ColIndex(col),
+        )
+        for row, col in found
+    ]
+
+
+# All cells that transitively depend on the given cell,
+# not including the cell itself.
+def get_dependents(cell_position):
+    start = (cell_position.row_index.value, cell_position.col_index.value)
+    return find_dependents({start}, get_direct_dependents(start))
+
+
+# All cells that transitively depend on cells of the box,
+# not including the cells of the box.
+def get_box_dependents(row_start, row_end, col_start, col_end):
+    starts = {
+        (row, col)
+        for row in range(row_start, row_end)
+        for col in range(col_start, col_end)
+    }
+
+    direct = set()
+    for key in starts:
+        direct.update(dependents.get(key, ()))
+
+    bounds, readers = get_box_index()
+    if len(readers) > 0:
+        overlapping = (bounds[:, 0] < row_end) & (row_start < bounds[:, 1]) \
+            & (bounds[:, 2] < col_end) & (col_start < bounds[:, 3])
+        direct.update(readers[i] for i in np.flatnonzero(overlapping))
+
+    return find_dependents(starts, direct)
+
+
+# Formulas that may read other cells once the sheet grows
+# along rows (axis 0) or columns (axis 1) from the bound, i.e. those
+# reading boxes to the bound, e.g. whole columns, and those reading
+# past it.
+def get_bound_readers(axis, bound):
+    found = set(out_of_bounds)
+
+    bounds, readers = get_box_index()
+    if len(readers) > 0:
+        ends = bounds[:, 1] if axis == 0 else bounds[:, 3]
+        found.update(readers[i] for i in np.flatnonzero(ends == bound))
+
+    return found
+
+
+# Track the cells appended to the sheet, which are empty.
+def grow(axis, number):
+    global dynamic
+    dynamic = masks.grow(dynamic, axis, number)
+
+
+def is_dynamic(key):
+    sheet_data.load_rows(key[0], key[0] + 1)
+    return masks.get(dynamic, *key)
+
+
+def get_dynamic(row_start, row_end, col_start, col_end):
+    sheet_data.load_rows(row_start, row_end)
+    return masks.get_region(dynamic, row_start, row_end, col_start, col_end)
+
+
+# Dynamic cells within the given bounds, relative to the start of the bounds.
+def get_dynamic_offsets(row_start, row_end, col_start, col_end):
+    return np.argwhere(get_dynamic(row_start, row_end, col_start, col_end))
+
+
+def add_formula(row, col, underlying_value):
+    cell_position = sel_types.CellPosition(
+        row_index=sel_types.RowIndex(row),
+        col_index=sel_types.ColIndex(col),
+    )
+    add((row, col), *compile_precedents(cell_position, underlying_value))
+
+
+# Track the dynamic cells among rows of a lazily opened file
+# as they are parsed.
+def add_rows(row_start, values):
+    mask = np.frompyfunc(is_dynamic_value, 1, 1)(values).astype(bool)
+    dynamic[row_start:row_start + len(values), :] = mask
+
+    for row, col in np.argwhere(mask):
+        underlying_value = values[row, col]
+        if graph.is_formula(underlying_value):
+            add_formula(int(row_start + row), int(col), underlying_value)
+
+
+# Set the DAG to the given references of formulas, e.g. from a snapshot,
+# rather than compiling every formula.
+def restore(
+    dynamic_cells, formula_precedents, formula_boxes, formula_out_of_bounds,
+):
+    global precedents, dependents, boxes, box_bounds, out_of_bounds
+    global dynamic
+    precedents = {}
+    dependents = {}
+    boxes = {}
+    box_bounds = None
+    out_of_bounds = formula_out_of_bounds
+    dynamic = dynamic_cells
+
+    for key in formula_precedents.keys() | formula_boxes.keys():
+        add(key, formula_precedents.get(key, []), formula_boxes.get(key, []))
+
+
+def init():
+    global precedents, dependents, boxes, box_bounds, out_of_bounds
+    global dynamic
+    precedents = {}
+    dependents = {}
+    boxes = {}
+    box_bounds = None
+    out_of_bounds = set()
+
+    if sheet_data.is_lazy():
+        dynamic = masks.new()
+        sheet_data.set_load_listener(add_rows)
+        return
+
+    # Sparse sheets give the mask as tiles, found from the cells in use.
+    dynamic = sheet_data.get_string_mask(is_dynamic_value)
+
+    for row, col in masks.get_cells(dynamic):
+        cell_position = sel_types.CellPosition(
+            row_index=sel_types.RowIndex(int(row)),
+            col_index=sel_types.ColIndex(int(col)),
+        )
+        underlying_value = sheet_data.get_cell_value(cell_position)
+        if graph.is_formula(underlying_value):
+            add_formula(int(row), int(col), underlying_value)
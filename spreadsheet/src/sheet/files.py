@@ -1,43 +1,251 @@
 import csv
 from flask import render_template
+import io
 import os
 import numpy as np
+import pandas as pd
+import time
+
+from settings import Settings
 
 import src.errors.types as err_types
 
-import src.sheet.compiler as compiler
+import src.sheet.cache as cache
 import src.sheet.data as sheet_data
+import src.sheet.inference as inference
+import src.sheet.lazy as lazy
+import src.sheet.parallel_csv as parallel_csv
+import src.sheet.snapshot as snapshot
+import src.sheet.dependencies as dependencies
+import src.sheet.text_index as text_index
+import src.sheet.workers as workers
+import src.sheet.saving as saving
 
 
 FILE_PATH = None
+# Messages about how the file was loaded, shown as a notification
+# rather than printed.
+load_messages = []
 
 
+# Returns whether the sheet was loaded from a snapshot.
 def setup(filepath, debug):
     global FILE_PATH
 
     if not filepath.endswith(".csv"):
         raise err_types.UserError("Input file is not a csv file.")
     FILE_PATH = filepath
+    load_messages.clear()
+    # The file may still be being saved, e.g. by a previous session.
+    saving.wait()
+    sheet_data.mark_clean()
+
+    if os.path.exists(FILE_PATH) and Settings.SNAPSHOT \
+            and load_snapshot():
+        text_index.init()
+        load_messages.append(f"Loaded {FILE_PATH} from its snapshot.")
+        return True
 
-    if os.path.exists(FILE_PATH):
-        open_file()
+    if os.path.exists(FILE_PATH) \
+            and os.path.getsize(FILE_PATH) >= Settings.LAZY_LOAD_THRESHOLD:
+        sheet_data.open_lazily(FILE_PATH)
+        load_messages.append(f"Opened {FILE_PATH} lazily.")
+    elif os.path.exists(FILE_PATH):
+        elapsed = open_file()
+        load_messages.append(f"Loaded {FILE_PATH} in {elapsed:.2f}s.")
     else:
         sheet_data.init(debug)
+    cache.init()
+    dependencies.init()
+    text_index.init()
+    return False
 
 
-# csv file to numpy array of Python values
-def open_file():
+def load_snapshot():
+    try:
+        return snapshot.load(FILE_PATH)
+    except (OSError, ValueError, KeyError) as e:
+        load_messages.append(f"Could not load snapshot of {FILE_PATH}: {e}.")
+        return False
+
+
+def get_load_message():
+    if len(load_messages) == 0:
+        return None
+    return " ".join(load_messages)
+
+
+# Snapshot the sheet as loaded from the file, if snapshots are enabled.
+def take_snapshot():
+    if Settings.SNAPSHOT and os.path.exists(FILE_PATH) \
+            and not sheet_data.is_lazy() and not sheet_data.is_sparse():
+        snapshot.save(FILE_PATH)
+
+
+def read_with_csv():
     # set newline='' so can properly handle newlines in strings
     with open(FILE_PATH, newline='') as file:
         reader = csv.reader(file, delimiter=',', quoting=csv.QUOTE_ALL)
-        data = np.array([row for row in reader], dtype=object)
-        sheet_data.set(data)
+        return inference.to_grid([row for row in reader])
 
 
-# numpy array of Python values to csv file
-def save():
-    # set newline='' so can properly handle newlines in strings
-    with open(FILE_PATH, 'w', newline='') as file:
-        writer = csv.writer(file, delimiter=',', quoting=csv.QUOTE_ALL)
-        data = sheet_data.get()
+# Read with pandas' C parser, which does not build a list per row.
+# Rows shorter than the first row are padded, but rows longer than it
+# are a parser error, in which case this returns None.
+def read_with_pandas():
+    try:
+        df = pd.read_csv(
+            FILE_PATH,
+            header=None,
+            dtype=object,
+            keep_default_na=False,
+            na_filter=False,
+            skip_blank_lines=False,
+            engine="c",
+        )
+    except pd.errors.EmptyDataError:
+        return np.empty((0, 0), dtype=object)
+    except pd.errors.ParserError:
+        return None
+    return df.to_numpy(dtype=object, copy=True)
+
+
+# csv file to numpy array of Python values
+def open_file():
+    start = time.perf_counter()
+
+    size = os.path.getsize(FILE_PATH)
+    # Parsing in parallel only pays off for the cost of
+    # sending columns between processes with several workers,
+    # and files too small to split into two ranges, including empty files,
+    # which cannot be mapped, are parsed here.
+    parallel_size = max(
+        Settings.PARALLEL_LOAD_THRESHOLD, 2 * parallel_csv.MIN_RANGE_SIZE,
+    )
+    if size >= parallel_size and workers.get_count() > 1:
+        try:
+            cols, nrows = parallel_csv.load(FILE_PATH)
+            sheet_data.set_columns(cols, nrows)
+            return time.perf_counter() - start
+        except Exception as e:
+            # e.g. the file is not valid utf-8 or a worker died,
+            # in which case it is read in this process instead.
+            load_messages.append(
+                f"Could not parse {FILE_PATH} in parallel: {e}."
+            )
+
+    data = None
+    if size >= Settings.FAST_LOAD_THRESHOLD:
+        data = read_with_pandas()
+    if data is None:
+        data = read_with_csv()
+
+    for col in range(data.shape[1]):
+        data[:, col] = inference.infer_column(data[:, col])
+    sheet_data.set(data)
+
+    return time.perf_counter() - start
+
+
+# Byte offset of the start of the row in the file, splitting rows on
+# newlines outside of quotes as the lazy index does.
+def find_row_offset(file, row):
+    quoted = np.uint8(0)
+    offset = 0
+    while row > 0:
+        chunk = np.frombuffer(file.read(lazy.CHUNK_SIZE), dtype=np.uint8)
+        if len(chunk) == 0:
+            break
+        parity = np.bitwise_xor.accumulate(chunk == ord('"'), dtype=np.uint8)
+        parity ^= quoted
+        quoted = parity[-1]
+        newlines = np.flatnonzero((chunk == ord("\n")) & (parity == 0))
+        if len(newlines) >= row:
+            return offset + int(newlines[row - 1]) + 1
+        row -= len(newlines)
+        offset += len(chunk)
+    return offset
+
+
+def write_rows(out, data):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    if data.size >= Settings.FAST_SAVE_THRESHOLD:
+        # pandas writes NaN as empty like None, unlike the csv module.
+        data[pd.isna(data) & np.not_equal(data, None)] = "nan"
+        pd.DataFrame(data).to_csv(
+            text,
+            header=False,
+            index=False,
+            quoting=csv.QUOTE_ALL,
+            lineterminator="\r\n",
+        )
+    else:
+        writer = csv.writer(text, delimiter=',', quoting=csv.QUOTE_ALL)
         writer.writerows(data)
+    text.flush()
+    text.detach()
+
+
+# Function writing the rows from the first dirty row on to a binary file,
+# after the bytes of the rows before it copied from the file as is.
+def get_writer(dirty_row):
+    bands = sheet_data.copy_rows(dirty_row, sheet_data.get_bounds().row.value)
+
+    def write(out):
+        if dirty_row > 0:
+            with open(FILE_PATH, "rb") as file:
+                offset = find_row_offset(file, dirty_row)
+                file.seek(0)
+                remaining = offset
+                while remaining > 0:
+                    chunk = file.read(min(lazy.CHUNK_SIZE, remaining))
+                    out.write(chunk)
+                    remaining -= len(chunk)
+                # The last row may not end with a newline.
+                if offset > 0:
+                    file.seek(offset - 1)
+                    if file.read(1) != b"\n":
+                        out.write(b"\r\n")
+        for data in bands:
+            write_rows(out, data)
+
+    return write
+
+
+# Start saving the sheet in the background, returning whether it had
+# changes to save. Rows before the first edited row are copied from the
+# file rather than written again.
+def save():
+    dirty_row = sheet_data.get_dirty_row()
+    if not os.path.exists(FILE_PATH):
+        dirty_row = 0
+    elif dirty_row is None:
+        return False
+    unsaved_row = saving.get_unsaved_row()
+    if unsaved_row is not None:
+        dirty_row = min(dirty_row, unsaved_row)
+
+    if sheet_data.is_lazy():
+        write = lazy.get_writer()
+    else:
+        write = get_writer(dirty_row)
+    sheet_data.mark_clean()
+    saving.submit(FILE_PATH, write, dirty_row)
+    return True
+
+
+def is_saving():
+    return saving.is_running()
+
+
+# Results of the saves finished since last called. Failed saves mark
+# their rows dirty again, and the sheet is snapshot if it is as saved.
+def pop_save_results():
+    results = saving.pop_finished()
+    for result in results:
+        if result.error is not None:
+            sheet_data.mark_dirty(result.dirty_row)
+    if len(results) > 0 and not saving.is_running() \
+            and sheet_data.get_dirty_row() is None:
+        take_snapshot()
+    return results
@@ -0,0 +1,107 @@
+# Functions available to formulas.
+#
+# References to a range of cells are bound as numpy arrays,
+# so these operate on arrays as well as single values.
+# As in other spreadsheets, aggregates skip empty cells and strings.
+
+import numpy as np
+
+
+def values(*args):
+    arrays = [
+        np.ravel(arg if isinstance(arg, np.ndarray) else np.asarray(arg, dtype=object))
+        for arg in args
+    ]
+    if len(arrays) == 0:
+        return np.array([], dtype=object)
+    return np.concatenate(arrays)
+
+
+def is_number(value):
+    return isinstance(value, (int, float, np.number)) \
+        and not isinstance(value, bool)
+
+
+def numbers(*args):
+    arrays = []
+    for arg in args:
+        if not isinstance(arg, np.ndarray):
+            arg = np.asarray(arg, dtype=object)
+        arr = np.ravel(arg)
+        if arr.dtype.kind in "iuf":
+            arrays.append(arr)
+        elif arr.dtype.kind == "O":
+            arrays.append(np.array([v for v in arr if is_number(v)]))
+    arrays = [arr for arr in arrays if len(arr) > 0]
+    if len(arrays) == 0:
+        return np.array([], dtype=float)
+    return np.concatenate(arrays)
+
+
+def to_value(value):
+    # Return Python values rather than numpy scalars.
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def SUM(*args):
+    return to_value(np.sum(numbers(*args)))
+
+
+def PRODUCT(*args):
+    return to_value(np.prod(numbers(*args)))
+
+
+def MEAN(*args):
+    arr = numbers(*args)
+    if len(arr) == 0:
+        raise ValueError("MEAN of no numbers")
+    return to_value(np.mean(arr))
+
+
+def MEDIAN(*args):
+    arr = numbers(*args)
+    if len(arr) == 0:
+        raise ValueError("MEDIAN of no numbers")
+    return to_value(np.median(arr))
+
+
+def MIN(*args):
+    arr = numbers(*args)
+    if len(arr) == 0:
+        raise ValueError("MIN of no numbers")
+    return to_value(np.min(arr))
+
+
+def MAX(*args):
+    arr = numbers(*args)
+    if len(arr) == 0:
+        raise ValueError("MAX of no numbers")
+    return to_value(np.max(arr))
+
+
+def COUNT(*args):
+    return len(numbers(*args))
+
+
+def COUNTA(*args):
+    return int(sum(1 for v in values(*args) if v is not None))
+
+
+# Combine values of references into one array,
+# e.g. to collect the neighbors of a cell.
+def CONCAT(*args):
+    return values(*args)
+
+
+library = {
+    "SUM": SUM,
+    "PRODUCT": PRODUCT,
+    "MEAN": MEAN,
+    "AVERAGE": MEAN,
+    "MEDIAN": MEDIAN,
+    "MIN": MIN,
+    "MAX": MAX,
+    "COUNT": COUNT,
+    "COUNTA": COUNTA,
+    "CONCAT": CONCAT,
+}
@@ -1,11 +1,13 @@
-import re
-from typing import Set
+from typing import Dict, List, Tuple
 
 import src.errors.types as err_types
 import src.selector.types as sel_types
 
+import src.sheet.cache as cache
 import src.sheet.compiler as compiler
 import src.sheet.data as sheet_data
+import src.sheet.dependencies as dependencies
+import src.sheet.functions as functions
 import src.sheet.markdown as markdown
 
 
@@ -17,97 +19,245 @@ def is_markdown(underlying_value):
     return isinstance(underlying_value, str) and underlying_value.startswith("!")
 
 
-def evaluate_dependencies(cell_position, node):
-    formula = node.formula
+# Values of a box of cells as an array,
+# which is 1-D if the box is a single row or column.
+# A column of numbers or booleans is a read-only view of its typed
+# storage rather than a copy.
+def compute_box(box):
+    row_start = box.row_range.start.value
+    row_end = box.row_range.end.value
+    col_start = box.col_range.start.value
+    col_end = box.col_range.end.value
 
-    eval_instances = re.finditer(
-            r"EVAL\<"
-            + r"(?P<register>[0-9]+)"
-            + r"\>",
-            formula,
-            )
+    if col_end - col_start == 1 and row_end - row_start > 1:
+        values = sheet_data.get_typed_values(col_start, row_start, row_end)
+        if values is not None:
+            return values
 
-    def eval_replace(instance):
-        register = int(instance.group("register"))
-        pos = node.get_dependency(register)
-        value = try_compute(pos)
-        compiled_value = compiler.value_to_code(value)
-        return compiled_value
-
-    formula = compiler.replace_instances(
-        formula,
-        eval_instances,
-        eval_replace,
+    values = sheet_data.get_region(row_start, row_end, col_start, col_end)
+    offsets = dependencies.get_dynamic_offsets(
+        row_start, row_end, col_start, col_end,
     )
-    return formula
+    for row, col in offsets:
+        values[row, col] = read(to_position(
+            (int(row_start + row), int(col_start + col))
+        ))
+
+    if row_end - row_start == 1:
+        return values[0, :]
+    if col_end - col_start == 1:
+        return values[:, 0]
+    return values
 
 
-def evaluate(cell_position, formula):
+def evaluate_dependencies(cell_position, node):
+    registers = {}
+    for register, dep in enumerate(node.dependencies):
+        if isinstance(dep, sel_types.CellPosition):
+            value = read(dep)
+        else:
+            value = compute_box(dep)
+        registers[compiler.register(register)] = value
+    return registers
+
+
+def evaluate(cell_position, node, registers):
+    # Bind dependencies as globals rather than locals
+    # so they are visible within comprehensions.
+    namespace = dict(globals())
+    namespace.update(functions.library)
+    namespace.update(registers)
     try:
-        value = eval(formula)
+        value = eval(node.code, namespace)
     except Exception as e:
         raise err_types.UserError(
             "Evaluation of compiled formula at cell position "
             f"({cell_position.row_index.value}, "
             f"{cell_position.col_index.value}) "
             f"encountered error: {e}.\n"
-            f"Compiled formula: {formula}"
+            f"Compiled formula: {node.formula}"
         )
     return value
 
 
-def compute_formula(cell_position, formula):
-    node = compiler.pre_compile(cell_position, formula)
-    formula_with_evaluated_deps = evaluate_dependencies(cell_position, node)
-    formula_post_compile = compiler.post_compile(cell_position, formula_with_evaluated_deps)
-    value = evaluate(cell_position, formula_post_compile)
-    return value
+def to_position(key):
+    return sel_types.CellPosition(
+        row_index=sel_types.RowIndex(key[0]),
+        col_index=sel_types.ColIndex(key[1]),
+    )
 
 
-def compute_underlying_value(cell_position, underlying_value):
-    if is_formula(underlying_value):
-        formula = underlying_value.removeprefix("=")
-        value = compute_formula(cell_position, formula)
-    elif is_markdown(underlying_value):
-        md = underlying_value.removeprefix("!")
-        value = markdown.convert_to_html(md)
-    else:
-        value = underlying_value
-    return value
+def needs_compute(key):
+    return dependencies.is_dynamic(key) \
+        and not cache.is_valid(to_position(key))
 
 
-# This function should not be called on the same
-# position more than once within a call-stack.
-# If it is, this indicates a dependency loop.
-visited: Set[sel_types.CellPosition] = set()
+# Value of a cell whose precedents have been computed.
+def read(cell_position):
+    if cache.is_valid(cell_position):
+        return cache.get_value(cell_position)
+    # Cells that are not dynamic are their own computed value.
+    assert not needs_compute(
+        (cell_position.row_index.value, cell_position.col_index.value)
+    )
+    return sheet_data.get_cell_value(cell_position)
 
 
-# This function will begin a tree of computation like so:
-# try_compute -> compute_underlying_value -> compute_formula -> evaluate_dependencies -> try_compute(dep)
-def try_compute(cell_position):
-    global visited
+def compile_cell(key):
+    underlying_value = sheet_data.get_cell_value(to_position(key))
+    if not is_formula(underlying_value):
+        return None
 
-    if cell_position in visited:
-        raise err_types.UserError(
-            "Dependency loop in computing cell values. "
-            "Cell at position ("
-            f"{cell_position.row_index.value},"
-            f"{cell_position.col_index.value}"
-            ") visited more than once."
+    formula = underlying_value.removeprefix("=")
+    try:
+        return compiler.compile_formula(to_position(key), formula)
+    except err_types.UserError as e:
+        return e
+    except err_types.OutOfBoundsError as e:
+        return err_types.UserError(
+            "Compilation of formula at cell position "
+            f"({key[0]}, {key[1]}) "
+            f"encountered error: {e}"
         )
 
+
+# Precedents of a compiled cell that have yet to be computed.
+def get_uncomputed_precedents(node):
+    if not isinstance(node, compiler.Node):
+        return []
+
+    precedents = []
+    for dep in node.dependencies:
+        if isinstance(dep, sel_types.CellPosition):
+            key = (dep.row_index.value, dep.col_index.value)
+            if needs_compute(key):
+                precedents.append(key)
+        else:
+            row_start = dep.row_range.start.value
+            col_start = dep.col_range.start.value
+            offsets = dependencies.get_dynamic_offsets(
+                row_start,
+                dep.row_range.end.value,
+                col_start,
+                dep.col_range.end.value,
+            )
+            for row, col in offsets:
+                key = (int(row_start + row), int(col_start + col))
+                if needs_compute(key):
+                    precedents.append(key)
+    return precedents
+
+
+# Find the cells that have to be computed for the given cells,
+# grouped into strongly-connected components with Tarjan's algorithm.
+# Components are ordered such that precedents come before dependents.
+# A component of more than one cell, or of a cell reading itself,
+# is a dependency loop.
+# This is iterative so long chains of formulas do not hit the recursion limit.
+def order_components(starts):
+    nodes: Dict[Tuple[int, int], object] = {}
+    edges: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+
+    def visit(key):
+        index[key] = len(index)
+        lowlink[key] = index[key]
+        stack.append(key)
+        on_stack.add(key)
+
+        nodes[key] = compile_cell(key)
+        edges[key] = get_uncomputed_precedents(nodes[key])
+        return (key, iter(edges[key]))
+
+    call_stack = []
+    for start in starts:
+        if start not in index and needs_compute(start):
+            call_stack.append(visit(start))
+
+        while len(call_stack) > 0:
+            key, it = call_stack[-1]
+
+            descended = False
+            for precedent in it:
+                if precedent not in index:
+                    call_stack.append(visit(precedent))
+                    descended = True
+                    break
+                elif precedent in on_stack:
+                    lowlink[key] = min(lowlink[key], index[precedent])
+            if descended:
+                continue
+
+            call_stack.pop()
+            if len(call_stack) > 0:
+                parent = call_stack[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[key])
+
+            if lowlink[key] == index[key]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == key:
+                        break
+                components.append(component)
+
+    return components, nodes, edges
+
+
+def compute_cell(key, node):
+    cell_position = to_position(key)
     underlying_value = sheet_data.get_cell_value(cell_position)
 
-    visited.add(cell_position)
-    value = compute_underlying_value(cell_position, underlying_value)
-    visited.remove(cell_position)
+    try:
+        if isinstance(node, err_types.UserError):
+            raise node
+        elif isinstance(node, compiler.Node):
+            registers = evaluate_dependencies(cell_position, node)
+            value = evaluate(cell_position, node, registers)
+        elif is_markdown(underlying_value):
+            md = underlying_value.removeprefix("!")
+            value = markdown.convert_to_html(md)
+        else:
+            value = underlying_value
+    except err_types.UserError as e:
+        # Also reached if a precedent failed, reporting the same error.
+        cache.set_failure(cell_position, e)
+        return
+    cache.set_value(cell_position, value)
+
 
-    return value
+def is_loop(component, edges):
+    return len(component) > 1 or component[0] in edges[component[0]]
 
 
+def compute_loop(component):
+    cells = ", ".join([f"({row}, {col})" for row, col in sorted(component)])
+    error = err_types.UserError(
+        "Dependency loop in computing cell values. "
+        f"Cells at positions {cells} depend on each other."
+    )
+    for key in component:
+        cache.set_failure(to_position(key), error)
+
+
+# Compute every uncomputed precedent exactly once, in order,
+# before computing the cell itself.
 def compute(cell_position):
-    # reset call stack
-    global visited
-    visited = set()
+    key = (cell_position.row_index.value, cell_position.col_index.value)
+    if not needs_compute(key):
+        return read(cell_position)
+
+    components, nodes, edges = order_components([key])
+    for component in components:
+        if is_loop(component, edges):
+            compute_loop(component)
+        else:
+            compute_cell(component[0], nodes[component[0]])
 
-    return try_compute(cell_position)
+    return cache.get_value(cell_position)
@@ -0,0 +1,149 @@
+import numpy as np
+
+import src.sheet.compiler as compiler
+
+
+def to_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+# Pad rows to the length of the longest row.
+def to_grid(rows):
+    ncols = max([len(row) for row in rows], default=0)
+    data = np.full((len(rows), ncols), "", dtype=object)
+    for i, row in enumerate(rows):
+        data[i, :len(row)] = row
+    return data
+
+
+# Words that convert to a value other than themselves.
+# Only these can convert among strings starting with a letter.
+words = {"nan", "inf", "infinity"}
+
+
+def is_word(string):
+    return string in ("True", "False") or string.rstrip().lower() in words
+
+
+# Mask of the strings that cannot convert to a value other than themselves.
+def get_unconvertible(strings):
+    first = np.array([s[:1] for s in strings], dtype="U1").view(np.uint32)
+    upper = first & ~np.uint32(32)
+    letter = (upper >= ord("A")) & (upper <= ord("Z"))
+
+    unconvertible = letter & ~np.isin(first, [ord(c) for c in "nNiITF"])
+    maybe_word = np.flatnonzero(letter & ~unconvertible)
+    unconvertible[maybe_word] = [not is_word(s) for s in strings[maybe_word]]
+    return unconvertible
+
+
+# Longest strings checked for being numbers in one pass,
+# which is enough for any int64 or float written out in full.
+NUMBER_WIDTH = 32
+INT_DIGITS = 18
+FLOAT_MARKS = np.array([ord(c) for c in ".eEnNiI"], dtype=np.uint32)
+
+
+# Masks of the strings that are integers, i.e. digits after an optional
+# sign, and of those that may be floats, i.e. only digits, signs, points
+# and exponents, found from their code points.
+def get_number_masks(strings):
+    ints = np.zeros(len(strings), dtype=bool)
+    floats = np.zeros(len(strings), dtype=bool)
+
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    short = np.flatnonzero(lengths <= NUMBER_WIDTH)
+    width = int(lengths[short].max(initial=1))
+    codes = strings[short].astype(f"U{width}") \
+        .view(np.uint32).reshape(len(short), width)
+
+    digit = (codes >= ord("0")) & (codes <= ord("9"))
+    sign = (codes == ord("-")) | (codes == ord("+"))
+    # Code points past the end of a string are zero, which strings
+    # holding zeros themselves are told apart from by their lengths.
+    end = codes == 0
+    ended = end.sum(axis=1) == width - lengths[short]
+    ndigits = digit.sum(axis=1)
+
+    leading = digit | end
+    leading[:, 0] |= sign[:, 0]
+    integral = ended & leading.all(axis=1) & (ndigits > 0)
+    # Longer integers do not fit in int64 and are left to convert
+    # one by one.
+    ints[short] = integral & (ndigits <= INT_DIGITS)
+
+    decimal = digit | sign | end | (codes == ord(".")) \
+        | (codes == ord("e")) | (codes == ord("E"))
+    floats[short] = ended & decimal.all(axis=1) & (ndigits > 0) & ~integral
+    return ints, floats
+
+
+def has_float_marks(strings):
+    width = max(map(len, strings), default=1)
+    codes = strings.astype(f"U{width}").view(np.uint32) \
+        .reshape(len(strings), width)
+    return np.isin(codes, FLOAT_MARKS).any(axis=1)
+
+
+# Convert a column of strings from a csv file to Python values,
+# as compiler.user_string_to_value does for a single string.
+# numpy converts strings by int and float as it does, so a column of
+# numbers is converted in one pass, as are the integers and floats
+# among other columns. Of the other strings, those that are clearly not
+# numbers or booleans are kept as is, and the rest convert each distinct
+# string once.
+def infer_column(strings):
+    values = np.empty(len(strings), dtype=object)
+    present = np.flatnonzero(strings != "")
+    strings = strings[present]
+
+    try:
+        values[present] = to_array(strings.astype(np.int64).tolist())
+        return values
+    except (ValueError, OverflowError):
+        pass
+
+    try:
+        numbers = strings.astype(np.float64)
+    except ValueError:
+        numbers = None
+    if numbers is not None:
+        values[present] = to_array(numbers.tolist())
+        # Of the whole numbers, those written without a point, exponent,
+        # nan or inf are integers.
+        whole = np.flatnonzero(numbers == np.trunc(numbers))
+        ints = whole[~has_float_marks(strings[whole])]
+        try:
+            converted = strings[ints].astype(np.int64).tolist()
+        except OverflowError:
+            converted = list(map(compiler.user_string_to_value, strings[ints]))
+        values[present[ints]] = to_array(converted)
+        return values
+
+    ints, floats = get_number_masks(strings)
+    values[present[ints]] = to_array(strings[ints].astype(np.int64).tolist())
+    try:
+        values[present[floats]] = to_array(
+            strings[floats].astype(np.float64).tolist()
+        )
+    except ValueError:
+        # e.g. "1e" or "-", which are left to convert one by one.
+        floats[:] = False
+
+    rest = ~(ints | floats)
+    present = present[rest]
+    strings = strings[rest]
+
+    unconvertible = get_unconvertible(strings)
+    values[present[unconvertible]] = strings[unconvertible]
+
+    converted = {}
+    def convert(string):
+        if string not in converted:
+            converted[string] = compiler.user_string_to_value(string)
+        return converted[string]
+    rest = ~unconvertible
+    values[present[rest]] = to_array(list(map(convert, strings[rest])))
+    return values
@@ -0,0 +1,329 @@
+from collections import OrderedDict
+import csv
+import io
+import mmap
+import numpy as np
+import os
+import threading
+
+from settings import Settings
+
+import src.sheet.inference as inference
+
+
+# Lazily opened csv file, for files too large to parse up front.
+#
+# The file is memory-mapped and the byte offset of each row is found in
+# a background thread, splitting on newlines outside of quotes.
+# Rows are parsed in blocks when first read, and the most recently read
+# blocks are kept in an LRU cache. The bounds of the sheet grow as rows
+# are indexed, and only change when refreshed, so they do not change
+# in the middle of a request.
+#
+# Edits are kept in an overlay over the file as opened, including after
+# it is saved, as the map is still of the file as opened.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+path = None
+file = None
+mm = None
+size = 0
+
+lock = threading.Lock()
+indexer = None
+# Offsets of the start of each row, of which the first count are filled.
+starts = None
+count = 0
+indexed_cols = 0
+indexed = False
+
+nrows = 0
+ncols = 0
+
+blocks = OrderedDict()
+overlay = {}
+# Called with the first row and values of a block when it is parsed,
+# e.g. to track formulas in it.
+listener = None
+registered = set()
+
+
+def is_open():
+    return mm is not None
+
+
+def open_file(filepath):
+    global path, file, mm, size, starts, count, indexed_cols, indexed
+    global nrows, ncols, blocks, overlay, indexer
+    close()
+
+    path = filepath
+    file = open(path, "rb")
+    size = os.path.getsize(path)
+    mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    starts = np.zeros(1024, dtype=np.int64)
+    count = 1
+    indexed_cols = 0
+    indexed = False
+    nrows = 0
+    ncols = 0
+    blocks = OrderedDict()
+    overlay = {}
+
+    indexer = threading.Thread(target=index, daemon=True)
+    indexer.start()
+    # Wait for the first rows so there is something to show.
+    while not indexed and count <= Settings.LAZY_BLOCK_ROWS:
+        indexer.join(0.01)
+    refresh()
+
+
+def close():
+    global mm, file, indexer
+    if indexer is not None:
+        indexer.join()
+        indexer = None
+    if mm is not None:
+        try:
+            mm.close()
+        except BufferError:
+            pass
+        mm = None
+    if file is not None:
+        file.close()
+        file = None
+
+
+def add_starts(new_starts, new_cols):
+    global starts, count, indexed_cols
+    with lock:
+        if count + len(new_starts) > len(starts):
+            grown = np.zeros(
+                max(2 * len(starts), count + len(new_starts)), dtype=np.int64,
+            )
+            grown[:count] = starts[:count]
+            starts = grown
+        starts[count:count+len(new_starts)] = new_starts
+        count += len(new_starts)
+        indexed_cols = max(indexed_cols, new_cols)
+
+
+# Find rows chunk by chunk. A newline or comma is outside of quotes if
+# an even number of quotes come before it, found from the running parity
+# of quotes carried between chunks. Escaped quotes ("") do not change it.
+def index():
+    global indexed
+
+    quoted = np.uint8(0)
+    fields = 1
+    for offset in range(0, size, CHUNK_SIZE):
+        chunk = np.frombuffer(
+            mm, dtype=np.uint8, count=min(CHUNK_SIZE, size - offset),
+            offset=offset,
+        )
+        parity = np.bitwise_xor.accumulate(chunk == ord('"'), dtype=np.uint8)
+        parity ^= quoted
+        quoted = parity[-1]
+
+        outside = parity == 0
+        newlines = np.flatnonzero((chunk == ord("\n")) & outside)
+        commas = np.flatnonzero((chunk == ord(",")) & outside)
+        del chunk, parity, outside
+
+        # Count fields of each row ending in this chunk,
+        # including the row carried over from the last chunk.
+        rows = np.searchsorted(newlines, commas)
+        per_row = np.bincount(rows, minlength=len(newlines) + 1) + 1
+        per_row[0] += fields - 1
+        fields = per_row[-1]
+
+        add_starts(newlines + offset + 1, int(per_row[:-1].max(initial=0)))
+
+    # The last row may not end with a newline.
+    if size > 0 and mm[size - 1] != ord("\n"):
+        add_starts(np.array([], dtype=np.int64), fields)
+    indexed = True
+
+
+def get_indexed_rows():
+    with lock:
+        rows = count - 1
+        if indexed and starts[count - 1] < size:
+            rows += 1
+    return rows
+
+
+# Update the bounds to the rows indexed so far,
+# returning whether they changed.
+def refresh():
+    global nrows, ncols, blocks
+    rows = get_indexed_rows()
+    cols = indexed_cols
+    changed = (rows, cols) != (nrows, ncols)
+    if cols != ncols:
+        # Blocks are parsed to the width of the sheet.
+        blocks = OrderedDict()
+    elif rows != nrows:
+        # The last block may have been parsed before all its rows were.
+        last = nrows // Settings.LAZY_BLOCK_ROWS
+        blocks.pop(last, None)
+        registered.discard(last)
+    nrows = rows
+    ncols = cols
+    return changed
+
+
+# Wait for every row to be indexed, returning the number of rows.
+# This does not refresh the bounds.
+def wait():
+    if indexer is not None:
+        indexer.join()
+    return get_indexed_rows()
+
+
+def get_shape():
+    return nrows, ncols
+
+
+def get_row_span(row_start, row_end):
+    start = starts[row_start]
+    end = starts[row_end] if row_end < count else size
+    return start, end
+
+
+# Rows parsed from the file, or from a copy of its map,
+# with the edits in the overlay, or in a copy of it.
+def parse_rows(row_start, row_end, width, source=None, edits=None):
+    source = mm if source is None else source
+    edits = overlay if edits is None else edits
+
+    start, end = get_row_span(row_start, row_end)
+    text = source[start:end].decode("utf-8")
+    reader = csv.reader(io.StringIO(text, newline=""), quoting=csv.QUOTE_ALL)
+
+    data = np.full((row_end - row_start, width), "", dtype=object)
+    for i, row in enumerate(reader):
+        if i >= len(data):
+            break
+        row = row[:width]
+        data[i, :len(row)] = row
+    for col in range(width):
+        data[:, col] = inference.infer_column(data[:, col])
+
+    for (row, col), value in edits.items():
+        if row_start <= row < row_end:
+            data[row - row_start, col] = value
+    return data
+
+
+def get_block(block):
+    values = blocks.get(block)
+    if values is not None:
+        blocks.move_to_end(block)
+        return values
+
+    row_start = block * Settings.LAZY_BLOCK_ROWS
+    row_end = min(row_start + Settings.LAZY_BLOCK_ROWS, nrows)
+    values = parse_rows(row_start, row_end, ncols)
+
+    blocks[block] = values
+    if len(blocks) > Settings.LAZY_CACHE_BLOCKS:
+        blocks.popitem(last=False)
+
+    if listener is not None and block not in registered:
+        registered.add(block)
+        listener(row_start, values)
+    return values
+
+
+# Parse the given rows if they have not been passed to the listener.
+def load_rows(row_start, row_end):
+    if listener is None:
+        return
+    block_rows = Settings.LAZY_BLOCK_ROWS
+    for block in range(row_start // block_rows, (row_end - 1) // block_rows + 1):
+        if block not in registered:
+            get_block(block)
+
+
+def set_listener(fn):
+    global listener, registered
+    listener = fn
+    registered = set()
+    for block, values in list(blocks.items()):
+        registered.add(block)
+        listener(block * Settings.LAZY_BLOCK_ROWS, values)
+
+
+def get_value(row, col):
+    return get_block(row // Settings.LAZY_BLOCK_ROWS)[
+        row % Settings.LAZY_BLOCK_ROWS, col
+    ]
+
+
+def set_value(row, col, value):
+    overlay[(row, col)] = value
+    values = blocks.get(row // Settings.LAZY_BLOCK_ROWS)
+    if values is not None:
+        values[row % Settings.LAZY_BLOCK_ROWS, col] = value
+
+
+def get_region(row_start, row_end, col_start, col_end):
+    data = np.empty((row_end - row_start, col_end - col_start), dtype=object)
+    block_rows = Settings.LAZY_BLOCK_ROWS
+    row = row_start
+    while row < row_end:
+        block = row // block_rows
+        block_end = min((block + 1) * block_rows, row_end)
+        values = get_block(block)
+        data[row - row_start:block_end - row_start] = values[
+            row - block * block_rows:block_end - block * block_rows,
+            col_start:col_end,
+        ]
+        row = block_end
+    return data
+
+
+# All values, once every row has been indexed.
+# Blocks are parsed without going through the LRU cache.
+def get_all():
+    rows = wait()
+    data = np.empty((rows, indexed_cols), dtype=object)
+    for row_start in range(0, rows, Settings.LAZY_BLOCK_ROWS):
+        row_end = min(row_start + Settings.LAZY_BLOCK_ROWS, rows)
+        data[row_start:row_end] = parse_rows(row_start, row_end, indexed_cols)
+    return data
+
+
+# Function writing the file with the current edits to a binary file,
+# copying the bytes of blocks without edits and writing the rest with
+# the csv module. It works on copies of the map and the overlay,
+# so it can be called on another thread while the sheet is edited.
+def get_writer():
+    source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    edits = dict(overlay)
+
+    def write(out):
+        rows = wait()
+        block_rows = Settings.LAZY_BLOCK_ROWS
+        edited = {row // block_rows for row, _ in edits}
+
+        text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+        writer = csv.writer(text, delimiter=",", quoting=csv.QUOTE_ALL)
+        for block in range((rows + block_rows - 1) // block_rows):
+            row_start = block * block_rows
+            row_end = min(row_start + block_rows, rows)
+            if block in edited:
+                writer.writerows(parse_rows(
+                    row_start, row_end, indexed_cols, source, edits,
+                ))
+            else:
+                start, end = get_row_span(row_start, row_end)
+                text.flush()
+                out.write(source[start:end])
+        text.flush()
+        text.detach()
+        source.close()
+
+    return write
@@ -0,0 +1,79 @@
+import numpy as np
+
+import src.sheet.data as sheet_data
+import src.sheet.sparse as sparse
+
+
+# Masks marking cells of the sheet, e.g. the cells that are formulas.
+# They are bool arrays of the bounds of the sheet, except for sparse
+# sheets, whose masks are kept as tiles like their values, so that they
+# grow with the tiles in use rather than with the bounds.
+# Arrays keep spare rows, which are never marked, so appending rows
+# does not copy them every time.
+def new():
+    if sheet_data.is_sparse():
+        return {}
+    bounds = sheet_data.get_bounds()
+    return np.zeros((bounds.row.value, bounds.col.value), dtype=bool)
+
+
+def is_tiled(mask):
+    return isinstance(mask, dict)
+
+
+def get(mask, row, col):
+    if is_tiled(mask):
+        return sparse.get_mask_value(mask, row, col)
+    return bool(mask[row, col])
+
+
+def set(mask, row, col, value):
+    if is_tiled(mask):
+        sparse.set_mask_value(mask, row, col, value)
+        return
+    mask[row, col] = value
+
+
+# Set the cells at the rows of (row, col).
+def set_cells(mask, cells, value):
+    if is_tiled(mask):
+        sparse.set_mask_cells(mask, cells[:, 0], cells[:, 1], value)
+        return
+    mask[cells[:, 0], cells[:, 1]] = value
+
+
+# Grow the mask by empty rows (axis 0) or columns (axis 1)
+# appended to the sheet.
+def grow(mask, axis, number):
+    if is_tiled(mask):
+        return mask
+
+    rows, cols = mask.shape
+    if axis == 1:
+        return np.concatenate(
+            [mask, np.zeros((rows, number), dtype=bool)], axis=1,
+        )
+    needed = sheet_data.get_bounds().row.value
+    if needed <= rows:
+        return mask
+    grown = np.zeros((max(2 * rows, needed), cols), dtype=bool)
+    grown[:rows] = mask
+    return grown
+
+
+def get_region(mask, row_start, row_end, col_start, col_end):
+    if is_tiled(mask):
+        return sparse.get_mask_region(
+            mask, row_start, row_end, col_start, col_end,
+        )
+    return mask[row_start:row_end, col_start:col_end]
+
+
+# Positions of the marked cells as rows of (row, col),
+# leaving out those marked in the excluded mask if given.
+def get_cells(mask, excluded=None):
+    if is_tiled(mask):
+        return sparse.get_mask_cells(mask, excluded)
+    if excluded is not None:
+        mask = mask & ~excluded
+    return np.argwhere(mask)
@@ -0,0 +1,111 @@
+import csv
+import io
+import mmap
+import numpy as np
+import os
+
+import src.sheet.columns as columns
+import src.sheet.inference as inference
+import src.sheet.workers as workers
+
+
+# Parse a csv file on several processes, each parsing a range of bytes.
+#
+# Ranges have to start and end on a row boundary, i.e. just after a newline
+# that is not inside quotes. Whether a byte is inside quotes depends on the
+# number of quotes before it, so first each worker counts the quotes in its
+# range, and the parity of the running total gives whether each range
+# starts inside quotes. Each worker then moves its start and end forward
+# to the next row boundary and parses the rows in between into typed
+# column blocks, which are joined column by column.
+CHUNK_SIZE = 4 * 1024 * 1024
+MIN_RANGE_SIZE = 8 * 1024 * 1024
+
+
+def map_file(path):
+    with open(path, "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def count_quotes(path, start, end):
+    mm = map_file(path)
+    count = 0
+    for offset in range(start, end, CHUNK_SIZE):
+        chunk = np.frombuffer(
+            mm, dtype=np.uint8, count=min(CHUNK_SIZE, end - offset),
+            offset=offset,
+        )
+        count += int(np.count_nonzero(chunk == ord('"')))
+        del chunk
+    mm.close()
+    return count
+
+
+# Start of the first row at or after the position,
+# given whether the position is inside quotes.
+def find_row_start(mm, position, quoted):
+    if position == 0:
+        return 0
+
+    size = len(mm)
+    quoted = np.uint8(quoted)
+    for offset in range(position, size, CHUNK_SIZE):
+        chunk = np.frombuffer(
+            mm, dtype=np.uint8, count=min(CHUNK_SIZE, size - offset),
+            offset=offset,
+        )
+        parity = np.bitwise_xor.accumulate(chunk == ord('"'), dtype=np.uint8)
+        parity ^= quoted
+        newlines = np.flatnonzero((chunk == ord("\n")) & (parity == 0))
+        quoted = parity[-1]
+        del chunk, parity
+        if len(newlines) > 0:
+            return offset + int(newlines[0]) + 1
+    return size
+
+
+def parse_range(path, start, end, start_quoted, end_quoted):
+    mm = map_file(path)
+    start = find_row_start(mm, start, start_quoted)
+    end = find_row_start(mm, end, end_quoted)
+    text = mm[start:end].decode("utf-8")
+    mm.close()
+
+    reader = csv.reader(io.StringIO(text, newline=""), quoting=csv.QUOTE_ALL)
+    data = inference.to_grid([row for row in reader])
+    return data.shape[0], [
+        columns.from_values(inference.infer_column(data[:, col]))
+        for col in range(data.shape[1])
+    ]
+
+
+# Parse the file into columns, returning them with the number of rows.
+def load(path):
+    size = os.path.getsize(path)
+    nranges = max(1, min(workers.get_count(), size // MIN_RANGE_SIZE))
+    bounds = [size * i // nranges for i in range(nranges + 1)]
+    pool = workers.get_executor()
+
+    counts = list(pool.map(
+        count_quotes,
+        [path] * nranges, bounds[:-1], bounds[1:],
+    ))
+    quoted = np.cumsum([0] + counts) % 2
+
+    parts = list(pool.map(
+        parse_range,
+        [path] * nranges, bounds[:-1], bounds[1:],
+        quoted[:-1].tolist(), quoted[1:].tolist(),
+    ))
+
+    # Pad parts to the width of the widest part, as for ragged rows.
+    ncols = max([len(part_columns) for _, part_columns in parts])
+    nrows = sum([part_rows for part_rows, _ in parts])
+    joined = []
+    for col in range(ncols):
+        joined.append(columns.concatenate([
+            part_columns[col] if col < len(part_columns)
+            else columns.empty(part_rows)
+            for part_rows, part_columns in parts
+        ]))
+    return joined, nrows
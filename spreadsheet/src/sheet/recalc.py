@@ -0,0 +1,108 @@
+# Recalculation of many cells at once, e.g. the whole sheet.
+#
+# The cells to compute are split into levels of the dependency DAG,
+# where each cell only depends on cells in earlier levels.
+# Formulas within a level are independent of each other, so large levels
+# are evaluated on a pool of worker processes. Each worker is only sent
+# the compiled source of its formulas and the values of their dependencies.
+
+import concurrent.futures
+
+from settings import Settings
+
+import src.errors.types as err_types
+
+import src.sheet.cache as cache
+import src.sheet.compiler as compiler
+import src.sheet.graph as graph
+import src.sheet.workers as workers
+
+
+# Runs in a worker process.
+def evaluate_chunk(chunk):
+    results = []
+    for key, source, registers in chunk:
+        node = compiler.Node(formula=source, dependencies=[])
+        node.code = compiler.compile_source(source)
+        try:
+            value = graph.evaluate(graph.to_position(key), node, registers)
+            results.append((key, value, None))
+        except err_types.UserError as e:
+            results.append((key, None, e))
+    return results
+
+
+def store_results(results):
+    for key, value, error in results:
+        if error is not None:
+            cache.set_failure(graph.to_position(key), error)
+        else:
+            cache.set_value(graph.to_position(key), value)
+
+
+def compute_in_parallel(formulas, nodes):
+    chunk = []
+    for key in formulas:
+        node = nodes[key]
+        try:
+            registers = graph.evaluate_dependencies(graph.to_position(key), node)
+        except err_types.UserError as e:
+            cache.set_failure(graph.to_position(key), e)
+            continue
+        chunk.append((key, node.formula, registers))
+
+    pool = workers.get_executor()
+    # Several chunks per worker so workers finishing early are not idle.
+    nchunks = workers.get_count() * 4
+    size = max(1, (len(chunk) + nchunks - 1) // nchunks)
+    chunks = [chunk[i:i+size] for i in range(0, len(chunk), size)]
+
+    futures = {pool.submit(evaluate_chunk, c): c for c in chunks}
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            results = future.result()
+        except Exception:
+            # Values that cannot be sent between processes,
+            # e.g. functions, are evaluated here instead.
+            results = evaluate_chunk(futures[future])
+        store_results(results)
+
+
+def get_levels(components, edges):
+    component_level = {}
+    levels = []
+    for i, component in enumerate(components):
+        members = set(component)
+        level = 0
+        for key in component:
+            for precedent in edges[key]:
+                if precedent not in members:
+                    level = max(level, component_level[precedent] + 1)
+        for key in component:
+            component_level[key] = level
+
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(component)
+    return levels
+
+
+def recalculate(keys):
+    components, nodes, edges = graph.order_components(keys)
+
+    for level in get_levels(components, edges):
+        formulas = []
+        for component in level:
+            key = component[0]
+            if graph.is_loop(component, edges):
+                graph.compute_loop(component)
+            elif isinstance(nodes[key], compiler.Node):
+                formulas.append(key)
+            else:
+                graph.compute_cell(key, nodes[key])
+
+        if len(formulas) >= Settings.RECALC_PARALLEL_THRESHOLD:
+            compute_in_parallel(formulas, nodes)
+        else:
+            for key in formulas:
+                graph.compute_cell(key, nodes[key])
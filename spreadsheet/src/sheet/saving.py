@@ -0,0 +1,120 @@
+import atexit
+from dataclasses import dataclass
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import List, Optional
+
+
+# Saves run one at a time on a background thread, so saving a large file
+# does not block requests. A file is written to a temporary file that is
+# synced to disk and renamed over it, so a crash mid-save leaves the
+# previous file as it was.
+@dataclass
+class Result:
+    elapsed: float
+    error: Optional[Exception]
+    # First row the save was to write, to mark dirty again if it failed.
+    dirty_row: int
+
+
+tasks = queue.Queue()
+thread = None
+lock = threading.Lock()
+running = 0
+finished: List[Result] = []
+# First rows of the saves that have yet to finish.
+pending: List[int] = []
+
+
+def run():
+    global running
+    while True:
+        path, write, dirty_row = tasks.get()
+        start = time.perf_counter()
+        try:
+            write_atomically(path, write)
+            error = None
+        except Exception as e:
+            error = e
+        with lock:
+            running -= 1
+            pending.remove(dirty_row)
+            finished.append(Result(
+                elapsed=time.perf_counter() - start,
+                error=error,
+                dirty_row=dirty_row,
+            ))
+        tasks.task_done()
+
+
+# Write the file by calling write with a temporary binary file.
+def write_atomically(path, write):
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Sync the directory so the rename itself is on disk.
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def submit(path, write, dirty_row):
+    global thread, running
+    with lock:
+        running += 1
+        pending.append(dirty_row)
+    if thread is None:
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+    tasks.put((path, write, dirty_row))
+
+
+# First row of the saves that have yet to finish or that failed without
+# being reported, or None. A save may fail and leave those rows out of
+# the file, so later saves should not copy them from it.
+def get_unsaved_row():
+    with lock:
+        rows = pending + [
+            result.dirty_row for result in finished
+            if result.error is not None
+        ]
+    return min(rows, default=None)
+
+
+def is_running():
+    with lock:
+        return running > 0
+
+
+# Results of the saves finished since last called.
+def pop_finished():
+    global finished
+    with lock:
+        results = finished
+        finished = []
+    return results
+
+
+# Wait for pending saves, e.g. before exiting.
+def wait():
+    if thread is not None:
+        tasks.join()
+
+
+atexit.register(wait)
@@ -0,0 +1,307 @@
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+
+import src.sheet.cache as cache
+import src.sheet.columns as columns
+import src.sheet.data as sheet_data
+import src.sheet.dependencies as dependencies
+import src.sheet.masks as masks
+
+
+# Snapshot of a parsed sheet next to its csv file, so reopening the file
+# does not parse it, compile its formulas or recompute the values that
+# were computed when it was saved.
+#
+# The snapshot is a directory of .npy files with a meta.json, so nothing
+# is unpickled. Typed column blocks are memory-mapped copy-on-write, so
+# only the rows read are loaded and edits stay in memory.
+# Strings are stored as their code points joined together with their
+# lengths, and cells holding values of mixed types as tags and strings.
+#
+# A snapshot is used if the file has the same size and either
+# the same modification time or the same hash as when it was taken.
+VERSION = 2
+HASH_CHUNK_SIZE = 16 * 1024 * 1024
+
+NONE = 0
+INT = 1
+FLOAT = 2
+BOOL = 3
+STRING = 4
+
+tags = {
+    int: INT,
+    float: FLOAT,
+    bool: BOOL,
+    str: STRING,
+}
+
+
+def get_path(filepath):
+    directory, name = os.path.split(os.path.abspath(filepath))
+    return os.path.join(directory, f".{name}.cache")
+
+
+def get_hash(filepath):
+    digest = hashlib.blake2b()
+    with open(filepath, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_strings(strings):
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    text = "".join(strings).encode("utf-32-le")
+    return np.frombuffer(text, dtype=np.uint32), lengths
+
+
+def decode_strings(text, lengths):
+    text = text.tobytes().decode("utf-32-le")
+    ends = np.cumsum(lengths).tolist()
+    starts = [0] + ends[:-1]
+    strings = np.empty(len(ends), dtype=object)
+    strings[:] = [text[start:end] for start, end in zip(starts, ends)]
+    return strings
+
+
+# Whether each value is None, an int, a float, a bool or a string,
+# which are the values that can be stored.
+def is_storable(values):
+    return np.frompyfunc(
+        lambda v: v is None or type(v) in tags, 1, 1,
+    )(values).astype(bool)
+
+
+def encode_values(values):
+    kinds = np.array(
+        [NONE if v is None else tags[type(v)] for v in values],
+        dtype=np.uint8,
+    )
+    text, lengths = encode_strings([
+        "" if v is None else v if isinstance(v, str) else repr(v)
+        for v in values
+    ])
+    return kinds, text, lengths
+
+
+def decode_values(kinds, text, lengths):
+    strings = decode_strings(text, lengths)
+    values = np.empty(len(strings), dtype=object)
+    for kind, convert in ((INT, int), (FLOAT, float), (STRING, str)):
+        rows = np.flatnonzero(kinds == kind)
+        values[rows] = [convert(s) for s in strings[rows]]
+    for row in np.flatnonzero(kinds == BOOL):
+        values[row] = strings[row] == "True"
+    return values
+
+
+def save_arrays(directory, arrays):
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+
+
+def load_array(directory, name, mmap_mode=None):
+    return np.load(
+        os.path.join(directory, f"{name}.npy"),
+        mmap_mode=mmap_mode,
+        allow_pickle=False,
+    )
+
+
+def save_column(directory, col, column):
+    prefix = f"col{col}"
+    arrays = {f"{prefix}.valid": column.valid}
+    if column.kind == columns.Kind.OBJECT:
+        kinds, text, lengths = encode_values(column.values)
+        arrays[f"{prefix}.kinds"] = kinds
+        arrays[f"{prefix}.text"] = text
+        arrays[f"{prefix}.lengths"] = lengths
+    else:
+        arrays[f"{prefix}.values"] = column.values
+    if column.kind == columns.Kind.STRING:
+        text, lengths = encode_strings(column.categories)
+        arrays[f"{prefix}.text"] = text
+        arrays[f"{prefix}.lengths"] = lengths
+    save_arrays(directory, arrays)
+
+
+def load_column(directory, col, kind):
+    prefix = f"col{col}"
+    valid = load_array(directory, f"{prefix}.valid", mmap_mode="c")
+    if kind == columns.Kind.OBJECT:
+        values = decode_values(
+            load_array(directory, f"{prefix}.kinds"),
+            load_array(directory, f"{prefix}.text"),
+            load_array(directory, f"{prefix}.lengths"),
+        )
+        return columns.Column(kind=kind, values=values, valid=valid)
+
+    column = columns.Column(
+        kind=kind,
+        values=load_array(directory, f"{prefix}.values", mmap_mode="c"),
+        valid=valid,
+    )
+    if kind == columns.Kind.STRING:
+        column.categories = decode_strings(
+            load_array(directory, f"{prefix}.text"),
+            load_array(directory, f"{prefix}.lengths"),
+        )
+    return column
+
+
+# Formulas reading cells and boxes, as arrays of the formulas'
+# positions and the number of cells or boxes each reads.
+def encode_references(references, width):
+    keys = np.array(list(references.keys()), dtype=np.int64).reshape(-1, 2)
+    counts = np.array(
+        [len(refs) for refs in references.values()], dtype=np.int64,
+    )
+    refs = np.array(
+        [ref for refs in references.values() for ref in refs], dtype=np.int64,
+    ).reshape(-1, width)
+    return keys, counts, refs
+
+
+def decode_references(keys, counts, refs):
+    ends = np.cumsum(counts).tolist()
+    starts = [0] + ends[:-1]
+    refs = [tuple(ref) for ref in refs.tolist()]
+    return {
+        tuple(key): refs[start:end]
+        for key, start, end in zip(keys.tolist(), starts, ends)
+    }
+
+
+def save_graph(directory):
+    keys, counts, cells = encode_references(dependencies.precedents, 2)
+    box_keys, box_counts, boxes = encode_references(dependencies.boxes, 4)
+    bounds = sheet_data.get_bounds()
+    save_arrays(directory, {
+        "dynamic": dependencies.get_dynamic(
+            0, bounds.row.value, 0, bounds.col.value,
+        ),
+        "precedents.keys": keys,
+        "precedents.counts": counts,
+        "precedents.cells": cells,
+        "boxes.keys": box_keys,
+        "boxes.counts": box_counts,
+        "boxes.boxes": boxes,
+        "out_of_bounds": np.array(
+            sorted(dependencies.out_of_bounds), dtype=np.int64,
+        ).reshape(-1, 2),
+    })
+
+
+def load_graph(directory):
+    precedents = decode_references(
+        load_array(directory, "precedents.keys"),
+        load_array(directory, "precedents.counts"),
+        load_array(directory, "precedents.cells"),
+    )
+    boxes = decode_references(
+        load_array(directory, "boxes.keys"),
+        load_array(directory, "boxes.counts"),
+        load_array(directory, "boxes.boxes"),
+    )
+    out_of_bounds = load_array(directory, "out_of_bounds")
+    dependencies.restore(
+        load_array(directory, "dynamic", mmap_mode="c"), precedents, boxes,
+        set(map(tuple, out_of_bounds.tolist())),
+    )
+
+
+# Computed values that can be stored, i.e. not failures, arrays or
+# functions. The others are computed again when needed.
+def save_computed(directory):
+    keys = masks.get_cells(cache.valid, cache.failed)
+    values = np.empty(len(keys), dtype=object)
+    values[:] = [cache.computed[key] for key in map(tuple, keys.tolist())]
+    storable = is_storable(values)
+    kinds, text, lengths = encode_values(values[storable])
+    save_arrays(directory, {
+        "computed.keys": keys[storable],
+        "computed.kinds": kinds,
+        "computed.text": text,
+        "computed.lengths": lengths,
+    })
+
+
+def load_computed(directory):
+    keys = load_array(directory, "computed.keys")
+    values = decode_values(
+        load_array(directory, "computed.kinds"),
+        load_array(directory, "computed.text"),
+        load_array(directory, "computed.lengths"),
+    )
+    cache.restore(keys, values)
+
+
+# Take a snapshot of the sheet as saved to the file.
+def save(filepath):
+    path = get_path(filepath)
+    temp_path = path + ".tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    sheet = sheet_data.get_columns()
+    for col, column in enumerate(sheet):
+        save_column(temp_path, col, column)
+    save_graph(temp_path)
+    save_computed(temp_path)
+
+    stat = os.stat(filepath)
+    meta = {
+        "version": VERSION,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": get_hash(filepath),
+        "nrows": sheet_data.nrows,
+        "kinds": [column.kind.value for column in sheet],
+    }
+    # The meta file is written last, so a partial snapshot is not used.
+    with open(os.path.join(temp_path, "meta.json"), "w") as file:
+        json.dump(meta, file)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(temp_path, path)
+
+
+def read_meta(filepath):
+    try:
+        with open(os.path.join(get_path(filepath), "meta.json")) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != VERSION:
+        return None
+
+    stat = os.stat(filepath)
+    if meta.get("size") != stat.st_size:
+        return None
+    if meta.get("mtime") != stat.st_mtime_ns \
+            and meta.get("hash") != get_hash(filepath):
+        return None
+    return meta
+
+
+# Load the snapshot of the file if it is up to date with the file,
+# returning whether it was. Raises OSError, ValueError or KeyError
+# if the snapshot cannot be read.
+def load(filepath):
+    meta = read_meta(filepath)
+    if meta is None:
+        return False
+
+    path = get_path(filepath)
+    cols = [
+        load_column(path, col, columns.Kind(kind))
+        for col, kind in enumerate(meta["kinds"])
+    ]
+    sheet_data.set_columns(cols, meta["nrows"])
+    load_graph(path)
+    load_computed(path)
+    return True
@@ -0,0 +1,320 @@
+import numpy as np
+from typing import Dict, Tuple
+
+
+# Sparse storage for large sheets that are mostly empty.
+#
+# The sheet is split into tiles of TILE_ROWS by TILE_COLS cells, and only
+# tiles holding a value are kept, as arrays of Python values keyed by the
+# position of the tile. So memory grows with the tiles in use rather than
+# with the bounds of the sheet.
+# Inserting, deleting and reordering rows or columns moves the cells in
+# use, as their positions, rather than tiles of cells.
+TILE_ROWS = 256
+TILE_COLS = 16
+
+tiles: Dict[Tuple[int, int], np.ndarray] = {}
+nrows = 0
+ncols = 0
+opened = False
+
+
+def is_open():
+    return opened
+
+
+def open_empty(rows, cols):
+    global tiles, nrows, ncols, opened
+    tiles = {}
+    nrows = rows
+    ncols = cols
+    opened = True
+
+
+def open_values(data):
+    open_empty(*data.shape)
+    set_region(0, nrows, 0, ncols, data)
+
+
+def close():
+    global tiles, opened
+    tiles = {}
+    opened = False
+
+
+def get_shape():
+    return nrows, ncols
+
+
+def is_valid(values):
+    return np.not_equal(values, None)
+
+
+# Tiles overlapping a box, with the part of the box each covers as
+# (row start, row end, col start, col end).
+def get_overlapping(row_start, row_end, col_start, col_end):
+    row_tiles = range(
+        row_start // TILE_ROWS, (row_end + TILE_ROWS - 1) // TILE_ROWS,
+    )
+    col_tiles = range(
+        col_start // TILE_COLS, (col_end + TILE_COLS - 1) // TILE_COLS,
+    )
+    for tile_row in row_tiles:
+        for tile_col in col_tiles:
+            yield (tile_row, tile_col), (
+                max(row_start, tile_row * TILE_ROWS),
+                min(row_end, (tile_row + 1) * TILE_ROWS),
+                max(col_start, tile_col * TILE_COLS),
+                min(col_end, (tile_col + 1) * TILE_COLS),
+            )
+
+
+def get_value(row, col):
+    tile = tiles.get((row // TILE_ROWS, col // TILE_COLS))
+    if tile is None:
+        return None
+    return tile[row % TILE_ROWS, col % TILE_COLS]
+
+
+# Fill an array of a box starting at the row and column with the tiles
+# of the source overlapping it.
+def copy_tiles(source, data, row_start, col_start):
+    rows, cols = data.shape
+    for key, (r0, r1, c0, c1) in get_overlapping(
+        row_start, row_start + rows, col_start, col_start + cols,
+    ):
+        tile = source.get(key)
+        if tile is None:
+            continue
+        tile_row = key[0] * TILE_ROWS
+        tile_col = key[1] * TILE_COLS
+        data[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = \
+            tile[r0 - tile_row:r1 - tile_row, c0 - tile_col:c1 - tile_col]
+
+
+# Copy of a box as an array of Python values, from the tiles or from
+# a copy of them.
+def get_region(row_start, row_end, col_start, col_end, source=None):
+    source = tiles if source is None else source
+
+    data = np.empty((row_end - row_start, col_end - col_start), dtype=object)
+    copy_tiles(source, data, row_start, col_start)
+    return data
+
+
+def set_region(row_start, row_end, col_start, col_end, values):
+    for key, (r0, r1, c0, c1) in get_overlapping(
+        row_start, row_end, col_start, col_end,
+    ):
+        part = values[
+            r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start
+        ]
+        tile = tiles.get(key)
+        if tile is None:
+            if not is_valid(part).any():
+                continue
+            tile = np.empty((TILE_ROWS, TILE_COLS), dtype=object)
+            tiles[key] = tile
+
+        tile_row = key[0] * TILE_ROWS
+        tile_col = key[1] * TILE_COLS
+        tile[r0 - tile_row:r1 - tile_row, c0 - tile_col:c1 - tile_col] = part
+        if not is_valid(tile).any():
+            del tiles[key]
+
+
+# Boxes of the sheet within a box that may hold values, as their first
+# row and column and their values, in order of rows then columns.
+def get_blocks(row_start, row_end, col_start, col_end):
+    for key, (r0, r1, c0, c1) in get_overlapping(
+        row_start, row_end, col_start, col_end,
+    ):
+        if key in tiles:
+            yield r0, c0, get_region(r0, r1, c0, c1)
+
+
+# Copy of rows of the sheet, made into arrays of values a band of
+# rows at a time as they are iterated, e.g. to save them.
+def copy_rows(row_start, row_end):
+    copied = {
+        key: tile.copy() for key, tile in tiles.items()
+        if row_start // TILE_ROWS <= key[0] <= (row_end - 1) // TILE_ROWS
+    }
+    width = ncols
+
+    def get_bands():
+        for start in range(row_start, row_end, TILE_ROWS):
+            end = min(start + TILE_ROWS, row_end)
+            yield get_region(start, end, 0, width, copied)
+
+    return get_bands()
+
+
+# Mask of the cells holding a string for which the predicate holds.
+def get_string_mask(predicate):
+    mask = {}
+    rows, cols, values = get_cells()
+    if len(values) > 0:
+        matched = np.frompyfunc(
+            lambda v: isinstance(v, str) and predicate(v), 1, 1,
+        )(values).astype(bool)
+        set_mask_cells(mask, rows[matched], cols[matched], True)
+    return mask
+
+
+# Positions and values of the cells in use.
+def get_cells():
+    rows = []
+    cols = []
+    values = []
+    for (tile_row, tile_col), tile in tiles.items():
+        used = np.argwhere(is_valid(tile))
+        rows.append(used[:, 0] + tile_row * TILE_ROWS)
+        cols.append(used[:, 1] + tile_col * TILE_COLS)
+        values.append(tile[used[:, 0], used[:, 1]])
+    if len(values) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=object)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+
+
+# Cells grouped by tile, as the position of each tile and the indices
+# of the cells within it.
+def group_by_tile(rows, cols):
+    tile_rows = rows // TILE_ROWS
+    tile_cols = cols // TILE_COLS
+    order = np.lexsort((tile_cols, tile_rows))
+    starts = np.flatnonzero(
+        (np.diff(tile_rows[order], prepend=-1) != 0)
+        | (np.diff(tile_cols[order], prepend=-1) != 0)
+    )
+    ends = np.append(starts[1:], len(order))
+
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        first = order[start]
+        yield (int(tile_rows[first]), int(tile_cols[first])), \
+            order[start:end]
+
+
+def set_cells(rows, cols, values):
+    global tiles
+    tiles = {}
+
+    for (tile_row, tile_col), cells in group_by_tile(rows, cols):
+        tile = np.empty((TILE_ROWS, TILE_COLS), dtype=object)
+        tile[
+            rows[cells] - tile_row * TILE_ROWS,
+            cols[cells] - tile_col * TILE_COLS,
+        ] = values[cells]
+        tiles[(tile_row, tile_col)] = tile
+
+
+# Insert empty rows (axis 0) or columns (axis 1) before the index.
+def insert(axis, index, number):
+    global nrows, ncols
+    rows, cols, values = get_cells()
+    positions = (rows, cols)[axis]
+    positions[positions >= index] += number
+    set_cells(rows, cols, values)
+    if axis == 0:
+        nrows += number
+    else:
+        ncols += number
+
+
+# Delete rows (axis 0) or columns (axis 1) at the indices.
+def delete(axis, indices):
+    global nrows, ncols
+    removed = np.unique(indices)
+    rows, cols, values = get_cells()
+    kept = ~np.isin((rows, cols)[axis], removed)
+    rows, cols, values = rows[kept], cols[kept], values[kept]
+    positions = (rows, cols)[axis]
+    positions -= np.searchsorted(removed, positions)
+    set_cells(rows, cols, values)
+    if axis == 0:
+        nrows -= len(removed)
+    else:
+        ncols -= len(removed)
+
+
+# Reorder rows such that row i is the row previously at order[i].
+def take_rows(order):
+    new_rows = np.empty(nrows, dtype=np.int64)
+    new_rows[order] = np.arange(nrows)
+    rows, cols, values = get_cells()
+    set_cells(new_rows[rows], cols, values)
+
+
+# Rotate rows (axis 0) or columns (axis 1) from low to high by the shift.
+def move(axis, low, high, shift):
+    rows, cols, values = get_cells()
+    positions = (rows, cols)[axis]
+    span = (positions >= low) & (positions < high)
+    positions[span] = low + (positions[span] - low + shift) % (high - low)
+    set_cells(rows, cols, values)
+
+
+def get_all():
+    return get_region(0, nrows, 0, ncols)
+
+
+# Masks marking cells of the sheet, e.g. its formulas, are kept like its
+# values, as tiles of flags keyed by the position of the tile.
+# Only tiles with a marked cell are kept.
+def get_mask_value(mask, row, col):
+    tile = mask.get((row // TILE_ROWS, col // TILE_COLS))
+    if tile is None:
+        return False
+    return bool(tile[row % TILE_ROWS, col % TILE_COLS])
+
+
+def set_mask_value(mask, row, col, value):
+    key = (row // TILE_ROWS, col // TILE_COLS)
+    tile = mask.get(key)
+    if tile is None:
+        if not value:
+            return
+        tile = np.zeros((TILE_ROWS, TILE_COLS), dtype=bool)
+        mask[key] = tile
+
+    tile[row % TILE_ROWS, col % TILE_COLS] = value
+    if not value and not tile.any():
+        del mask[key]
+
+
+def set_mask_cells(mask, rows, cols, value):
+    for key, cells in group_by_tile(rows, cols):
+        tile = mask.get(key)
+        if tile is None:
+            if not value:
+                continue
+            tile = np.zeros((TILE_ROWS, TILE_COLS), dtype=bool)
+            mask[key] = tile
+
+        tile[
+            rows[cells] - key[0] * TILE_ROWS,
+            cols[cells] - key[1] * TILE_COLS,
+        ] = value
+        if not value and not tile.any():
+            del mask[key]
+
+
+def get_mask_region(mask, row_start, row_end, col_start, col_end):
+    data = np.zeros((row_end - row_start, col_end - col_start), dtype=bool)
+    copy_tiles(mask, data, row_start, col_start)
+    return data
+
+
+# Positions of the marked cells, as rows of (row, col), leaving out
+# those marked in the excluded mask if given.
+def get_mask_cells(mask, excluded=None):
+    found = [np.zeros((0, 2), dtype=np.int64)]
+    for key, tile in mask.items():
+        if excluded is not None and key in excluded:
+            tile = tile & ~excluded[key]
+        cells = np.argwhere(tile)
+        cells[:, 0] += key[0] * TILE_ROWS
+        cells[:, 1] += key[1] * TILE_COLS
+        found.append(cells)
+    return np.concatenate(found)
@@ -0,0 +1,234 @@
+from dataclasses import dataclass
+import numpy as np
+import re
+from typing import Dict, Set, Tuple
+
+import src.errors.types as err_types
+
+
+# Index of the computed string values of cells by their trigrams,
+# so searching for text only checks the cells containing all its trigrams.
+# Trigrams are of lowercased values so they serve case-insensitive
+# searches too.
+# Searches that cannot use trigrams, i.e. short text and regular
+# expressions, scan the values in blocks of rows. Only cells holding
+# strings are kept, by block, so mostly empty sheets are cheap to index.
+# Columns that are all strings are kept as string arrays so they are
+# scanned with numpy.
+# Edited cells and their dependents are marked stale and re-indexed
+# on the next search, rather than computed on every edit.
+N = 3
+BLOCK_SIZE = 4096
+
+strings: Dict[Tuple[int, int], str] = {}
+block_keys: Dict[int, Set[Tuple[int, int]]] = {}
+grams: Dict[str, Set[Tuple[int, int]]] = {}
+string_columns: Dict[int, np.ndarray] = {}
+stale: Set[Tuple[int, int]] = set()
+built = False
+
+
+@dataclass
+class Query:
+    text: str
+    case_sensitive: bool = True
+    regex: bool = False
+
+
+def get_grams(text):
+    text = text.lower()
+    return {text[i:i+N] for i in range(len(text) - N + 1)}
+
+
+def init():
+    global strings, block_keys, grams, string_columns, stale, built
+    strings = {}
+    block_keys = {}
+    grams = {}
+    string_columns = {}
+    stale = set()
+    built = False
+
+
+def is_built():
+    return built
+
+
+def remove(key):
+    value = strings.pop(key, None)
+    if value is None:
+        return
+    keys = block_keys[key[0] // BLOCK_SIZE]
+    keys.discard(key)
+    if len(keys) == 0:
+        del block_keys[key[0] // BLOCK_SIZE]
+    for gram in get_grams(value):
+        keys = grams[gram]
+        keys.discard(key)
+        if len(keys) == 0:
+            del grams[gram]
+
+
+def add(key, value):
+    if not isinstance(value, str):
+        return
+    strings[key] = value
+    block = key[0] // BLOCK_SIZE
+    if block not in block_keys:
+        block_keys[block] = set()
+    block_keys[block].add(key)
+    for gram in get_grams(value):
+        if gram not in grams:
+            grams[gram] = set()
+        grams[gram].add(key)
+
+
+# Index the computed values of a sheet of the number of rows,
+# given as boxes of values by their first row and column, in order
+# of rows. Cells outside the boxes are empty.
+def build(blocks, nrows):
+    global built
+    init()
+
+    # Parts of the columns that are all strings so far.
+    parts: Dict[int, list] = {}
+    covered: Dict[int, int] = {}
+    broken: Set[int] = set()
+    for row_start, col_start, values in blocks:
+        # Only check the types of the values that are not empty.
+        is_str = np.not_equal(values, None)
+        is_str[is_str] = np.frompyfunc(
+            lambda v: isinstance(v, str), 1, 1,
+        )(values[is_str]).astype(bool)
+        for row, col in np.argwhere(is_str):
+            add(
+                (row_start + int(row), col_start + int(col)),
+                values[row, col],
+            )
+
+        all_str = is_str.all(axis=0)
+        for i in range(values.shape[1]):
+            col = col_start + i
+            if col in broken:
+                continue
+            if not all_str[i] or covered.get(col, 0) != row_start:
+                broken.add(col)
+                parts.pop(col, None)
+                continue
+            parts.setdefault(col, []).append(values[:, i].astype(str))
+            covered[col] = row_start + values.shape[0]
+
+    for col, column in parts.items():
+        if covered[col] == nrows:
+            string_columns[col] = np.concatenate(column)
+    built = True
+
+
+# Appended rows are empty, so no column is all strings anymore.
+def grow(axis):
+    global string_columns
+    if axis == 0:
+        string_columns = {}
+
+
+def mark_stale(keys):
+    if built:
+        stale.update(keys)
+
+
+def pop_stale():
+    global stale
+    keys = stale
+    stale = set()
+    return keys
+
+
+def update(key, value):
+    remove(key)
+    add(key, value)
+
+    row, col = key
+    column = string_columns.get(col)
+    if column is None:
+        return
+    if not isinstance(value, str):
+        del string_columns[col]
+        return
+    # Widen the column if the value does not fit.
+    if len(value) > column.dtype.itemsize // 4:
+        column = column.astype(f"U{len(value)}")
+        string_columns[col] = column
+    column[row] = value
+
+
+def get_matcher(query):
+    if query.regex:
+        flags = 0 if query.case_sensitive else re.IGNORECASE
+        try:
+            pattern = re.compile(query.text, flags)
+        except re.error as e:
+            raise err_types.UserError(
+                f"Search text is not a valid regular expression: {e}."
+            )
+        return lambda value: pattern.search(value) is not None
+    elif query.case_sensitive:
+        return lambda value: query.text in value
+    else:
+        text = query.text.lower()
+        return lambda value: text in value.lower()
+
+
+def scan_column(query, column):
+    if query.case_sensitive:
+        return np.char.find(column, query.text) >= 0
+    return np.char.find(np.char.lower(column), query.text.lower()) >= 0
+
+
+# Scan blocks of rows so a search stopping early only scans up to
+# the block of its last match, and a search resuming from a position
+# starts from its block.
+def scan(query, matches, position):
+    for block in sorted(block_keys):
+        if block < position[0] // BLOCK_SIZE:
+            continue
+        start = block * BLOCK_SIZE
+        found = []
+        scanned = set()
+        if not query.regex:
+            for col, column in string_columns.items():
+                rows = np.flatnonzero(
+                    scan_column(query, column[start:start+BLOCK_SIZE]),
+                )
+                found.extend((start + int(row), col) for row in rows)
+                scanned.add(col)
+        found.extend(
+            key for key in block_keys[block]
+            if key[1] not in scanned and key >= position
+            and matches(strings[key])
+        )
+        yield from sorted(key for key in found if key >= position)
+
+
+def find(query, matches, position):
+    if query.regex or len(query.text) < N:
+        found = scan(query, matches, position)
+    else:
+        postings = sorted(
+            [grams.get(gram, set()) for gram in get_grams(query.text)],
+            key=len,
+        )
+        candidates = postings[0].intersection(*postings[1:])
+        found = (
+            key for key in sorted(candidates)
+            if key >= position and matches(strings[key])
+        )
+
+    for key in found:
+        yield key, strings[key]
+
+
+# Cells at or after the (row, col) position whose value matches the
+# query, in row-major order, with their values.
+# Matches are found as they are consumed.
+def search(query, position=(0, 0)):
+    return find(query, get_matcher(query), position)
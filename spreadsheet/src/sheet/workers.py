@@ -0,0 +1,24 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+from settings import Settings
+
+
+# Pool of worker processes shared by recalculation and loading files.
+executor = None
+
+
+def get_count():
+    return Settings.WORKERS or os.cpu_count() or 1
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        # Spawn rather than fork as the server is multi-threaded.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=get_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return executor
@@ -49,6 +49,7 @@ def move_upperleft(method):
                     f"Unexpected move port method: {method}."
                 )
 
+        sheet.sync_bounds()
         bounds = sheet.data.get_bounds()
 
         row = upperleft.row_index.value
@@ -44,6 +44,14 @@ window.addEventListener('keydown', async function(event) {
           document.getElementById("save-button").click();
           break;
 
+        // undo
+        case 'u':
+          document.getElementById("undo-button").click();
+          break;
+        case 'U':
+          document.getElementById("redo-button").click();
+          break;
+
         // selector
         case 'f':
           if (document.getElementById("command-palette").style.display == 'none') {